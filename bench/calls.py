@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import start
+from parse import Parser
+from start import *
+
+"""
+    Recursive function calls under eval: fib(n) and n calls of
+    fact(40). Each runs with every function interpreted, with the
+    functions eval compiles (see make_function) but no memoization,
+    and as eval runs it by default, compiled and memoized.
+
+        python bench/calls.py [n]
+"""
+
+def programs(n):
+    calls = "".join("fact(40);" for _ in range(n))
+    return {
+        f"fib({n})": f"letfun fib(n)= if n<2 then n else fib(n-1)+fib(n-2) end in fib({n});",
+        f"{n} x fact(40)": f"letfun fact(n)= if n>1 then n*fact(n-1) else 1 end in {{ {calls} }}",
+    }
+
+def timed(program):
+    t = time.perf_counter()
+    eval(program)
+    return time.perf_counter() - t
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 22
+    closed_function, memo_size = start.closed_function, start.memo_size
+    for name, source in programs(n).items():
+        program = Parser.from_source(source).parse_expr()
+        memoized = timed(program)
+        try:
+            start.memo_size = 0
+            compiled = timed(program)
+            start.closed_function = lambda name, params, body: False
+            interpreted = timed(program)
+        finally:
+            start.closed_function, start.memo_size = closed_function, memo_size
+        print(f"{name:<20}interpreted {interpreted:.3f}s  compiled {compiled:.3f}s ({interpreted / compiled:.1f}x)"
+              f"  memoized {memoized:.4f}s ({interpreted / memoized:.0f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import start
+from parse import Parser
+from start import *
+from vm import run
+
+"""
+    A loop that builds a string with n concats, run by the VM with
+    ropes (see concat) and with every concat copying, for growing n.
+    With ropes the time grows linearly in n.
+
+        python bench/concat.py [largest n]
+"""
+
+def concat_source(n):
+    return f"""let s=String "" in
+let t=String "abcd" in
+let i=0 in
+{{
+    for i<{n} up i+=1 do
+    {{
+        s=s.concat t;
+    }};
+    let n=s.length in
+    print n;
+}}
+"""
+
+def timed(program):
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(program)
+    return time.perf_counter() - t
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rope_min = start.rope_min
+    n = largest // 8
+    while n <= largest:
+        program = Parser.from_source(concat_source(n)).parse_expr()
+        with_ropes = timed(program)
+        start.rope_min = sys.maxsize
+        try:
+            copying = timed(program)
+        finally:
+            start.rope_min = rope_min
+        print(f"n={n:<8}ropes {with_ropes:.3f}s  copying {copying:.3f}s")
+        n *= 2
+
+if __name__ == "__main__":
+    main()
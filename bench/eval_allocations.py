@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import tracemalloc
+
+from suite import best_of, count_evaluated, run_eval, scripts
+from parse import Parser
+
+"""
+    What eval allocates while it runs the example programs, the
+    scripts bench/suite.py runs: Euler_problems/, ANS/ and myfile.txt
+    (the Euler_problems ones are notes in an older syntax and stop at
+    their first token). For each it reports the peak memory that
+    tracemalloc traces during eval above what was traced before it,
+    the number of eval calls and the eval time (best of --repeat
+    runs).
+
+        python bench/eval_allocations.py [--repeat 5]
+"""
+
+def peak_memory(program):
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        run_eval(program)
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sys.setrecursionlimit(100000)
+
+    print(f"{'script':<24}{'calls':>10}{'eval us':>10}{'peak KiB':>10}")
+    for path in scripts():
+        name = os.path.basename(path)
+        with open(path) as f:
+            program = Parser.from_source(f.read()).parse_expr()
+        try:
+            best, _ = best_of(args.repeat, run_eval, program)
+        except Exception as error:
+            print(f"{name:<24}skipped: {type(error).__name__}")
+            continue
+        calls = count_evaluated(program)
+        peak = peak_memory(program)
+        print(f"{name:<24}{calls:>10}{best * 1e6:>10.0f}{peak / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
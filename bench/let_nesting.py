@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from start import *
+from vm import VM, compile_program
+
+"""
+    Variable lookup cost against let nesting depth.
+
+    Builds `let v0=0 in let v1=0 in ... let i=0 in for i<N up i+=1 do
+    v0=v0+1` for increasing depths and reports the time per loop
+    iteration for each engine. Environment lookups in eval scan every
+    enclosing scope, the slot addressed backends do not.
+
+        python bench/let_nesting.py [iterations]
+"""
+
+DEPTHS = [1, 2, 4, 8, 16, 32, 64]
+
+def nested_program(depth, iterations):
+    i = Variable("i")
+    outer = Variable("v0")
+    loop = For(BinOp("<", i, NumLiteral(iterations)),
+               BinOp("+=", i, NumLiteral(1)),
+               Put(outer, BinOp("+", outer, NumLiteral(1))))
+    program = Let(i, NumLiteral(0), Seq([loop, outer]))
+    for d in reversed(range(depth)):
+        program = Let(Variable(f"v{d}"), NumLiteral(0), program)
+    return program
+
+def timed(prepare, program):
+    execute = prepare(program)
+    start = time.perf_counter()
+    execute()
+    return time.perf_counter() - start
+
+# Each entry compiles the program up front and returns a function
+# running it, so only execution is timed.
+engines = {
+    "eval": lambda program: lambda: eval(program),
+    "closure": compile_to_closures,
+    "vm": lambda program: partial(VM().execute, compile_program(program)),
+}
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'depth':>6}" + "".join(f"{name:>12}" for name in engines) + "   (ns per iteration)")
+    for depth in DEPTHS:
+        program = nested_program(depth, iterations)
+        row = [timed(prepare, program) / iterations * 1e9 for prepare in engines.values()]
+        print(f"{depth:>6}" + "".join(f"{t:>12.0f}" for t in row))
+
+if __name__ == "__main__":
+    main()
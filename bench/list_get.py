@@ -0,0 +1,52 @@
+import io
+import contextlib
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse import Parser
+from start import *
+from vm import run
+from nested_loops import nested_source
+
+"""
+    Cost of one list read in the nested loops of myfile.txt. The loop
+    runs once as is and once with every `integers.get x` replaced by
+    `x`; the difference divided by the number of reads is the cost of
+    a read, for each engine.
+
+        python bench/list_get.py [n]
+"""
+
+engines = {
+    "eval": eval,
+    "vm": run,
+    "closure": lambda program: compile_to_closures(program)(),
+}
+
+def best_time(function, program, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(program)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    source = nested_source(n)
+    with_get = Parser.from_source(source).parse_expr()
+    without_get = Parser.from_source(re.sub(r"integers\.get (\w+)", r"\1", source)).parse_expr()
+    reads = 3 * n * (n - 1) * (n - 2) // 6
+    for name, function in engines.items():
+        t_get = best_time(function, with_get)
+        t_plain = best_time(function, without_get)
+        print(f"{name:<8}{reads} reads  {(t_get - t_plain) / reads * 1e9:>8.0f} ns per read")
+
+if __name__ == "__main__":
+    main()
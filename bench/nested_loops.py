@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse import Parser
+from start import *
+
+"""
+    The triple nested for loop of myfile.txt (find p+q == r among the
+    triples of a list) over a longer list, run by eval.
+
+    With n elements the innermost body runs n*(n-1)*(n-2)/6 times; the
+    default n=183 makes that about 10^6 iterations.
+
+        python bench/nested_loops.py [n]
+"""
+
+def nested_source(n):
+    values = ",".join(str(v) for v in range(1, n + 1))
+    return f"""let integers=list [{values}] in
+let l=integers.length in
+let a=0 in
+let i=0 in
+{{
+    for i<l up i+=1 do
+        let j=i+1 in
+        for j<l up j+=1 do
+            let k=j+1 in
+            for k<l up k+=1 do
+                let p=integers.get i in
+                let q=integers.get j in
+                let r=integers.get k in
+                if p+q == r then {{
+                    a=a+1;
+                }}; end;
+    print a;
+}}
+"""
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 183
+    program = Parser.from_source(nested_source(n)).parse_expr()
+    iterations = n * (n - 1) * (n - 2) // 6
+    start = time.perf_counter()
+    eval(program)
+    elapsed = time.perf_counter() - start
+    print(f"{iterations} iterations in {elapsed:.2f}s ({elapsed / iterations * 1e9:.0f} ns per iteration)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parse import Parser
+from start import *
+from vm import run
+
+"""
+    A VM loop that prints n lines, written to os.devnull line by line
+    through sys.stdout (as print did), buffered through sys.stdout,
+    and buffered straight to the file descriptor. Pass a path to write
+    to that instead (a terminal, say /dev/tty, shows the difference
+    best).
+
+        python bench/printing.py [n] [path]
+"""
+
+def printing_source(n):
+    return f"""let i=0 in
+for i<{n} up i+=1 do
+{{
+    print i;
+}};
+"""
+
+def timed(program, path, limit, to_fd):
+    stdout = sys.stdout
+    output.limit = limit
+    if to_fd:
+        output.to_file(path)
+    else:
+        sys.stdout = open(path, "w")
+    t = time.perf_counter()
+    try:
+        run(program)
+        output.close()
+        if not to_fd:
+            sys.stdout.flush()
+    finally:
+        if not to_fd:
+            sys.stdout.close()
+        sys.stdout = stdout
+        output.limit = 0
+    return time.perf_counter() - t
+
+def best_time(program, path, limit, to_fd, repeat=5):
+    return min(timed(program, path, limit, to_fd) for _ in range(repeat))
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    path = sys.argv[2] if len(sys.argv) > 2 else os.devnull
+    program = Parser.from_source(printing_source(n)).parse_expr()
+    empty = Parser.from_source(printing_source(n).replace("print i;", "i;")).parse_expr()
+    loop = best_time(empty, path, 0, False)
+    for name, limit, to_fd in [("line by line", 0, False), ("buffered", output_buffer, False),
+                               ("buffered to fd", output_buffer, True)]:
+        t = best_time(program, path, limit, to_fd)
+        print(f"{name:<16}{t:.3f}s  printing {(t - loop) / n * 1e9:.0f} ns per line")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import start
+from start import *
+from parse import Keyword, Parser, TokenArray
+
+"""
+    Benchmark suite over the example programs: Euler_problems/, ANS/
+    and myfile.txt.
+
+    Every script goes through each phase on its own, timed separately:
+
+      lex    - TokenArray.from_source
+      parse  - Parser.parse_expr over the tokens
+      check  - the operand typechecks eval runs (check_bitwise, ...)
+               for every node that has one
+      eval   - eval with the program's output discarded
+
+    A phase time is the best of --repeat runs. A second, untimed pass
+    counts eval calls (for nodes evaluated per second) and a third
+    one measures the peak traced memory of each phase.
+
+    --scale multiplies the loop bounds: literal bounds in for/while
+    conditions, the let bound numbers they compare against, and the
+    length of list literals (which bound the loops over a list).
+    A script that fails in some phase is reported as skipped with the
+    error, and the remaining phases are not run.
+
+    --json writes the results; --compare reads an earlier results file
+    and exits with status 1 when a phase got slower than its old time
+    by more than --threshold (a fraction, 0.1 is 10%).
+
+        python bench/suite.py [--scale 10] [--json out.json]
+                              [--compare old.json --threshold 0.1]
+"""
+
+phases = ["lex", "parse", "check", "eval"]
+
+def scripts():
+    paths = sorted(glob.glob(os.path.join(root, "Euler_problems", "*.txt")))
+    paths += sorted(glob.glob(os.path.join(root, "ANS", "*.txt")))
+    paths.append(os.path.join(root, "myfile.txt"))
+    return paths
+
+loop_bound = re.compile(r"\b(for|while)\s+\w+\s*(?:<=|<|!=)\s*(\w+)")
+list_literal = re.compile(r"list\s*\[([^\]]*)\]")
+
+def scale_source(source, factor):
+    if factor == 1:
+        return source
+    names = set()
+    def scale_bound(m):
+        bound = m.group(2)
+        if bound.isdigit():
+            return m.group(0)[:-len(bound)] + str(int(bound) * factor)
+        names.add(bound)
+        return m.group(0)
+    source = loop_bound.sub(scale_bound, source)
+    for name in names:
+        source = re.sub(rf"\blet\s+{name}\s*=\s*(\d+)\b",
+                        lambda m: m.group(0)[:-len(m.group(1))] + str(int(m.group(1)) * factor), source)
+    return list_literal.sub(lambda m: f"list [{','.join([m.group(1)] * factor)}]", source)
+
+def checks(program):
+    match program:
+        case BinOp(op, left, right) if op in Bitwise_operators:
+            yield check_bitwise, (left, right)
+        case BinOp("+=", left, right):
+            yield check_add_assign, (left, right)
+        case StringOp('add', left, right):
+            yield check_concat, (left, right)
+        case StringOp('compare', left, right):
+            yield check_compare, (left, right)
+        case StringOp('length', left):
+            yield check_length, (left,)
+    if isinstance(program, list):
+        for thing in program:
+            yield from checks(thing)
+    elif hasattr(program, "__dataclass_fields__") and not isinstance(program, type):
+        for name in program.__dataclass_fields__:
+            yield from checks(getattr(program, name))
+
+def run_checks(program):
+    return [static_check(check, *operands) for check, operands in checks(program)]
+
+def run_eval(program):
+    with contextlib.redirect_stdout(io.StringIO()):
+        eval(program)
+
+def count_evaluated(program):
+    calls = 0
+    original = start.eval
+    def counting(program, environment=None):
+        nonlocal calls
+        calls += 1
+        return original(program, environment)
+    start.eval = counting
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            counting(program)
+    finally:
+        start.eval = original
+    return calls
+
+def best_of(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = function(*args)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best, result
+
+def bench_script(path, factor, repeat):
+    with open(path) as f:
+        source = scale_source(f.read(), factor)
+    result = {"status": "ok", "times": {}, "peak_memory": {}}
+    times = result["times"]
+    phase = "lex"
+    try:
+        times["lex"], tokens = best_of(repeat, TokenArray.from_source, source)
+        phase = "parse"
+        def parse():
+            tokens.reset(0)
+            return Parser(tokens).parse_expr()
+        times["parse"], program = best_of(repeat, parse)
+        # Most scripts end with a stray `end` the parser leaves alone.
+        if any(token != Keyword("end") for token in tokens.tokens[tokens.pos:]):
+            raise InvalidProgram(f"parsing stopped at token {tokens.pos} of {len(tokens.tokens)}")
+        phase = "check"
+        times["check"], _ = best_of(repeat, run_checks, program)
+        phase = "eval"
+        times["eval"], _ = best_of(repeat, run_eval, program)
+    except Exception as error:
+        result["status"] = f"skipped: {phase} raised {type(error).__name__}: {error}"
+        return result
+
+    nodes = count_evaluated(program)
+    result["nodes_evaluated"] = nodes
+    result["nodes_per_sec"] = nodes / times["eval"] if times["eval"] else None
+
+    tracemalloc.start()
+    try:
+        for name, function, args in [("lex", TokenArray.from_source, (source,)),
+                                     ("parse", lambda: Parser.from_source(source).parse_expr(), ()),
+                                     ("check", run_checks, (program,)),
+                                     ("eval", run_eval, (program,))]:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            function(*args)
+            result["peak_memory"][name] = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return result
+
+def regressions(results, baseline, threshold):
+    found = []
+    for script, result in results["scripts"].items():
+        old = baseline.get("scripts", {}).get(script)
+        if old is None:
+            continue
+        for phase in phases:
+            new_time = result["times"].get(phase)
+            old_time = old.get("times", {}).get(phase)
+            if new_time is None or not old_time:
+                continue
+            if new_time > old_time * (1 + threshold):
+                found.append((script, phase, old_time, new_time))
+    return found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", type=str, help="write the results to this file")
+    parser.add_argument("--compare", type=str, help="results file to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+    sys.setrecursionlimit(100000)
+
+    results = {
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "scripts": {},
+    }
+    print(f"{'script':<36}" + "".join(f"{phase:>10}" for phase in phases) + f"{'nodes/s':>12}{'peak KiB':>10}")
+    for path in scripts():
+        name = os.path.relpath(path, root)
+        result = bench_script(path, args.scale, args.repeat)
+        results["scripts"][name] = result
+        if result["status"] != "ok":
+            print(f"{name:<36}  {result['status']}")
+            continue
+        times = "".join(f"{result['times'][phase] * 1e3:>8.2f}ms" for phase in phases)
+        peak = max(result["peak_memory"].values()) / 1024
+        print(f"{name:<36}{times}{result['nodes_per_sec']:>12.0f}{peak:>10.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            sys.exit(f"{args.compare} was run with --scale {baseline.get('scale')}, not {args.scale}")
+        found = regressions(results, baseline, args.threshold)
+        for script, phase, old_time, new_time in found:
+            print(f"regression: {script} {phase} {old_time * 1e3:.2f}ms -> {new_time * 1e3:.2f}ms")
+        if found:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
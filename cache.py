@@ -0,0 +1,121 @@
+from dataclasses import dataclass
+import hashlib
+import os
+import pickle
+import sys
+
+"""
+    ProgramCache keeps the front end's output for a source file on
+    disk, in the same spirit as __pycache__. Entries live in a
+    __thcache__ directory next to the source, one pickle per entry,
+    named by a hash of the source text, what is stored (an AST or VM
+    code) and the interpreter version.
+
+    The interpreter version hashes the interpreter's own source files
+    and the Python version, so changing the language implementation
+    invalidates every entry. Reading an entry touches its mtime and
+    after a write the least recently used entries are removed until
+    the directory is under max_size bytes.
+
+    The cache is only an accelerator: unreadable or corrupt entries
+    count as misses and failing to write one is ignored.
+"""
+
+cache_dirname = "__thcache__"
+interpreter_files = ["start.py", "vm.py", "parse.py", "cache.py", "optimizer.py", "profiler.py",
+                     "iterative.py"]
+
+interpreter_hash = None
+
+def interpreter_version():
+    global interpreter_hash
+    if interpreter_hash is None:
+        h = hashlib.sha256(sys.version.encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in interpreter_files:
+            with open(os.path.join(here, name), "rb") as f:
+                h.update(f.read())
+        interpreter_hash = h.hexdigest()
+    return interpreter_hash
+
+@dataclass
+class ProgramCache:
+    directory: str
+    max_size: int = 64 * 1024 * 1024
+
+    def for_file(filename, max_size=64 * 1024 * 1024):
+        directory = os.path.join(os.path.dirname(os.path.abspath(filename)), cache_dirname)
+        return ProgramCache(directory, max_size)
+
+    def key(self, source: str, kind: str) -> str:
+        h = hashlib.sha256(interpreter_version().encode())
+        h.update(kind.encode())
+        h.update(source.encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # Unpickling a corrupt file can fail with almost any exception.
+        except Exception:
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        temp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, "wb") as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except (OSError, pickle.PicklingError, RecursionError):
+            self.remove(temp)
+            return
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Drops least recently used entries until the total size fits.
+    def evict(self):
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".pickle"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+        except OSError:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    self.remove(entry.path)
+        except OSError:
+            pass
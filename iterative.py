@@ -0,0 +1,259 @@
+from start import *
+
+"""
+    An evaluator with the semantics of eval (dynamic scoping through
+    Environment) that does not recurse on the Python stack, so deep
+    recursion in a Thorium program is only bounded by memory.
+
+    Evaluating a node is a generator (steps) that yields the child
+    nodes it needs and is sent their values back; eval_iterative
+    keeps the suspended generators on a list and runs one at a time.
+    Literals and variables are looked up by the driver directly,
+    without a generator.
+
+    A generator returns Tail(node) when its value is the value of
+    node and it has nothing left to do: the driver replaces it with
+    node's generator instead of stacking that on top. If, IfElse,
+    the last thing in a Seq, and/or and the body of a Let or LetFun
+    inside a function body use it.
+
+    Calls in tail position of a function body are proper tail calls.
+    A function's scopes sit on top of the scope its call opened
+    (base); a Let in tail position of the body leaves its scope for
+    the return of the function to drop. A tail call merges the scopes
+    above base into it, adds the new parameters there and continues
+    with the callee's body under the same return. Merging keeps the
+    innermost binding of each name, which is the one every lookup and
+    update would see until the call returns, so lookups give the same
+    results as eval's and a chain of tail calls uses one scope.
+"""
+
+@dataclass(slots=True)
+class Tail:
+    node: 'AST'
+    base: Optional[int]
+
+# A function body to run under a new return; base is the index of
+# the scope the call opened.
+@dataclass(slots=True)
+class Body:
+    node: 'AST'
+    base: int
+
+literal_nodes = (NumLiteral, StringLiteral, IntLiteral, FracLiteral, BoolLiteral)
+
+def steps(program, environment, base):
+    match program:
+        case NumLiteral(value) | StringLiteral(value) | IntLiteral(value) | FracLiteral(value) \
+                | ListLiteral(value) | BoolLiteral(value):
+            return value
+        case Variable():
+            return environment.get(program)
+
+        case Let(Variable(_) as v, e1, e2):
+            v1 = yield e1
+            environment.enter_scope()
+            environment.add(v, v1)
+            if base is not None:
+                return Tail(e2, base)
+            v2 = yield e2
+            environment.exit_scope()
+            return v2
+
+        case LetConst(Variable(name), e1, e2):
+            v1 = yield e1
+            if(environment.check(name) != None):
+                output.write("Variable name exists")
+                raise InvalidProgram()
+            environment.enter_scope()
+            environment.add(name, v1)
+            v2 = yield e2
+            environment.exit_scope()
+            return v2
+
+        case Put(Variable(_) as v, e):
+            environment.update(v, (yield e))
+            return environment.get(v)
+        case Get(Variable(_) as v):
+            return environment.get(v)
+        case Seq(things):
+            if not things:
+                return None
+            for thing in things[:-1]:
+                yield thing
+            return Tail(things[-1], base)
+
+        case BinOp(left=left, right=right, opcode=opcode) if opcode < pure_binary_count:
+            left_value = yield left
+            return pure_binary_table[opcode](left_value, (yield right))
+        case BinOp("/", left, right):
+            if(right==0):
+                raise InvalidProgram()
+            left_value = yield left
+            return divide(left_value, (yield right))
+        case BinOp("//", left, right):
+            if(right==0):
+                raise InvalidProgram()
+            left_value = yield left
+            return left_value // (yield right)
+        case BinOp("%", left, right):
+            if(right==0):
+                raise InvalidProgram()
+            left_value = yield left
+            return left_value % (yield right)
+        case BinOp("&" | "|" | "^" | ">>" | "<<", left, right, opcode=opcode) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            left_value = yield left
+            return binary_table[opcode](left_value, (yield right))
+        case BinOp("+=", left, right) as node:
+            environment.check_once(check_add_assign, node, left, right)
+            val = yield Get(left)
+            new_val = NumLiteral(val + (yield right))
+            yield Put(left, new_val)
+            return new_val.value
+
+        case PrintOp(inp):
+            output.write((yield inp))
+            return
+
+        case StringOp('add', left, right) as node:
+            environment.check_once(check_concat, node, left, right)
+            left_value = yield left
+            return concat(left_value, (yield right))
+        case StringOp('compare', left, right) as node:
+            environment.check_once(check_compare, node, left, right)
+            left_value = yield left
+            return left_value == (yield right)
+        case StringOp('length', left) as node:
+            environment.check_once(check_length, node, left)
+            return len((yield left))
+        case StringSlice("slice", left, start, stop, step):
+            left_value = yield left
+            start_value = yield start
+            stop_value = yield stop
+            return slice_text(left_value, start_value, stop_value, (yield step))
+
+        case UnOp('-' | '++' | '--' as op, vari):
+            un = NumLiteral(unary_functions[op]((yield vari)))
+            yield Put(vari, un)
+            return un.value
+
+        case LogOp("and", left, right):
+            left_value = yield left
+            return Tail(right, base) if left_value else left_value
+        case LogOp("or", left, right):
+            left_value = yield left
+            return left_value if left_value else Tail(right, base)
+        case LogOp("not", right):
+            return not (yield right)
+
+        case If(c, b):
+            if (yield c) == True:
+                return Tail(b, base)
+            return
+        case IfElse(c, l, r):
+            return Tail(l if (yield c) == True else r, base)
+
+        case ListOp("append", left, right):
+            l = yield left
+            return list_append(l, (yield right))
+        case ListOp('length', left):
+            return len((yield left))
+        case ListOp('assign', array, index, assign):
+            arr = yield array
+            value = yield assign
+            return list_assign(arr, (yield index), value)
+        case ListOp('remove', array):
+            arr = yield array
+            arr.pop()
+            return arr
+        case ListOp('pop', array, index):
+            if(index!=NumType):
+                raise InvalidProgram
+            arr = yield array
+            arr.remove(index)
+            return arr
+        case ListOp('get', array, index):
+            arr = yield array
+            return list_get(arr, (yield index))
+
+        case Un_boolify(left):
+            return unboolify((yield left))
+
+        case For(condition, update, body):
+            while (yield condition):
+                yield body
+                yield update
+            return
+        case Whilethen(condition, then_body):
+            while (yield condition) == True:
+                yield then_body
+            return
+
+        case LetFun(Variable(_) as v, params, body, expr):
+            environment.enter_scope()
+            environment.add(v, FnObject(params, body))
+            if base is not None:
+                return Tail(expr, base)
+            v = yield expr
+            environment.exit_scope()
+            return v
+
+        case FunCall(Variable(_) as v, args):
+            fn = environment.get(v)
+            argv = []
+            for arg in args:
+                argv.append((yield arg))
+            if len(argv) != len(fn.params):
+                raise InvalidProgram()
+            envs = environment.envs
+            if base is not None:
+                scope = envs[base]
+                for inner in envs[base + 1:]:
+                    scope.update(inner)
+                del envs[base + 1:]
+                for param, arg in zip(fn.params, argv):
+                    scope[param] = arg
+                return Tail(fn.body, base)
+            environment.enter_scope()
+            for param, arg in zip(fn.params, argv):
+                environment.add(param, arg)
+            call_base = len(envs) - 1
+            v = yield Body(fn.body, call_base)
+            del envs[call_base:]
+            return v
+
+    raise InvalidProgram()
+
+def eval_iterative(program: AST, environment: Environment = None) -> Value:
+    if environment is None:
+        environment = Environment()
+    get = environment.get
+    suspended = []
+    routine = steps(program, environment, None)
+    value = None
+    while True:
+        try:
+            node = routine.send(value)
+        except StopIteration as stop:
+            value = stop.value
+            if type(value) is Tail:
+                routine = steps(value.node, environment, value.base)
+                value = None
+                continue
+            if not suspended:
+                return value
+            routine = suspended.pop()
+            continue
+        kind = type(node)
+        if kind in literal_nodes:
+            value = node.value
+        elif kind is Variable:
+            value = get(node)
+        else:
+            suspended.append(routine)
+            if kind is Body:
+                routine = steps(node.node, environment, node.base)
+            else:
+                routine = steps(node, environment, None)
+            value = None
@@ -0,0 +1,218 @@
+from start import *
+from dataclasses import fields, is_dataclass
+
+"""
+    optimize rewrites a parsed program before it is run:
+
+      - BinOp, LogOp and StringOp nodes whose operands are literals
+        are replaced by the literal they evaluate to (unless that
+        raises, then the node is kept so the error still happens at
+        run time),
+      - If and IfElse with a literal condition are replaced by the
+        branch that would run,
+      - x*1, 1*x, x+0, 0+x and x-0 become x when x is known to be a
+        number.
+
+    UnOp is not folded: it assigns its result back to its operand, so
+    on a literal it is an error that has to be kept.
+
+    The operands of the operators that typecheck them (bitwise, +=
+    and the string operators) are left exactly as they are, since
+    rewriting them could change what the check sees. The literal
+    types used for folding have the same typecheck type as the nodes
+    they replace everywhere else.
+
+    "Known to be a number" is decided by numeric_names: the names whose
+    every binding and assignment is a numeric expression. It starts
+    from all the assigned names and drops the ones with an assignment
+    that is not numeric until nothing changes. Function names and
+    parameters are never numeric.
+"""
+
+literal_types = (NumLiteral, BoolLiteral, StringLiteral)
+arithmetic_operators = "+ - * / // % **".split()
+checked_binary_operators = Bitwise_operators + ["+="]
+
+# Folding these with a big right operand would build huge numbers
+# the program might never use.
+fold_limit = 1024
+
+def literal(value):
+    match value:
+        case bool():
+            return BoolLiteral(value)
+        case int() | Fraction():
+            return NumLiteral(value)
+        case str():
+            return StringLiteral(value)
+    return None
+
+def count_nodes(program) -> int:
+    if isinstance(program, list):
+        return sum(count_nodes(thing) for thing in program)
+    if not is_dataclass(program) or isinstance(program, type):
+        return 0
+    return 1 + sum(count_nodes(getattr(program, f.name)) for f in fields(program))
+
+def assignments(program, assigned, unknown):
+    def walk(node):
+        assignments(node, assigned, unknown)
+    match program:
+        case Let(Variable(name), e1, e2) | LetConst(Variable(name), e1, e2):
+            assigned.setdefault(name, []).append(e1)
+        case Put(Variable(name), e):
+            assigned.setdefault(name, []).append(e)
+        case BinOp("+=", Variable(name) as v, right):
+            assigned.setdefault(name, []).append(BinOp("+", v, right))
+        case UnOp(_, Variable(name) as v):
+            assigned.setdefault(name, []).append(BinOp("-", v, NumLiteral(1)))
+        case LetFun(Variable(name), params, _, _):
+            unknown.add(name)
+            unknown.update(p.name for p in params)
+    if isinstance(program, list):
+        for thing in program:
+            walk(thing)
+    elif is_dataclass(program) and not isinstance(program, type):
+        for f in fields(program):
+            walk(getattr(program, f.name))
+
+def is_numeric(program, names) -> bool:
+    match program:
+        case NumLiteral() | IntLiteral() | FracLiteral():
+            return True
+        case Variable(name):
+            return name in names
+        case BinOp(op, left, right) if op in arithmetic_operators:
+            return is_numeric(left, names) and is_numeric(right, names)
+    return False
+
+def numeric_names(program) -> set:
+    assigned = {}
+    unknown = set()
+    assignments(program, assigned, unknown)
+    names = set(assigned) - unknown
+    changed = True
+    while changed:
+        changed = False
+        for name in list(names):
+            if not all(is_numeric(e, names) for e in assigned[name]):
+                names.discard(name)
+                changed = True
+    return names
+
+def is_one(program):
+    return isinstance(program, NumLiteral) and program.value == 1
+
+def is_zero(program):
+    return isinstance(program, NumLiteral) and program.value == 0
+
+@dataclass
+class Optimizer:
+    numeric: set
+
+    def fold_binary(self, node):
+        left, right = node.left, node.right
+        if not isinstance(left, literal_types) or not isinstance(right, literal_types):
+            return node
+        if node.operator in ("**", "<<") and isinstance(right, NumLiteral) and abs(right.value) > fold_limit:
+            return node
+        function = binary_table[node.opcode] if node.opcode < unknown_opcode else None
+        if function is None:
+            return node
+        try:
+            value = function(left.value, right.value)
+        except Exception:
+            return node
+        folded = literal(value)
+        return node if folded is None else folded
+
+    def simplify(self, node):
+        match node:
+            case BinOp("*", x, one) if is_one(one) and is_numeric(x, self.numeric):
+                return x
+            case BinOp("*", one, x) if is_one(one) and is_numeric(x, self.numeric):
+                return x
+            case BinOp("+" | "-", x, zero) if is_zero(zero) and is_numeric(x, self.numeric):
+                return x
+            case BinOp("+", zero, x) if is_zero(zero) and is_numeric(x, self.numeric):
+                return x
+        return node
+
+    def rewrite(self, program):
+        o = self.optimize
+        match program:
+            # A literal operand the check rejects stays for the run
+            # time check to reject.
+            case BinOp(op, left, right) if op in Bitwise_operators:
+                if static_check(check_bitwise, left, right) is not None:
+                    return program
+                return self.fold_binary(program)
+            case BinOp(op) if op in checked_binary_operators:
+                return self.fold_binary(program)
+            case StringSlice():
+                return StringSlice(program.operator, o(program.left), o(program.right), o(program.type),
+                                   o(program.start), o(program.stop), o(program.step))
+            case StringOp('add', StringLiteral(left), StringLiteral(right)):
+                return StringLiteral(f"{left}{right}")
+            case StringOp('compare', StringLiteral(left), StringLiteral(right)):
+                return BoolLiteral(left == right)
+            case StringOp('length', StringLiteral(left)):
+                return NumLiteral(len(left))
+            case StringOp():
+                return program
+            case BinOp(op, left, right, t):
+                node = BinOp(op, o(left), o(right), t)
+                return self.simplify(self.fold_binary(node))
+            case LogOp("not", left):
+                left = o(left)
+                if isinstance(left, literal_types):
+                    return BoolLiteral(not left.value)
+                return LogOp("not", left)
+            case LogOp(op, left, right, t):
+                left, right = o(left), o(right)
+                if isinstance(left, literal_types) and op in ("and", "or"):
+                    if bool(left.value) == (op == "and"):
+                        return right
+                    return left
+                return LogOp(op, left, right, t)
+            case If(c, b, t):
+                c = o(c)
+                if isinstance(c, literal_types):
+                    return o(b) if c.value == True else Seq([])
+                return If(c, o(b), t)
+            case IfElse(c, l, r, t):
+                c = o(c)
+                if isinstance(c, literal_types):
+                    return o(l) if c.value == True else o(r)
+                return IfElse(c, o(l), o(r), t)
+            case Let(v, e1, e2, t):
+                return Let(v, o(e1), o(e2), t)
+            case LetConst(v, e1, e2):
+                return LetConst(v, o(e1), o(e2))
+            case LetFun(v, params, body, expr, size):
+                return LetFun(v, params, o(body), o(expr), size)
+            case Put(var, e):
+                return Put(var, o(e))
+            case Seq(things):
+                return Seq([o(thing) for thing in things])
+            case PrintOp(inp):
+                return PrintOp(o(inp))
+            case ListOp(op, left, right, assign, t):
+                return ListOp(op, o(left), o(right), o(assign), t)
+            case For(condition, update, body):
+                return For(o(condition), o(update), o(body))
+            case Whilethen(condition, then_body):
+                return Whilethen(o(condition), o(then_body))
+            case FunCall(fn, args):
+                return FunCall(fn, [o(arg) for arg in args])
+        return program
+
+    # A node built in place of another takes over its source span.
+    def optimize(self, program):
+        node = self.rewrite(program)
+        if node is not program and isinstance(node, Node) and node.span is None:
+            node.span = getattr(program, "span", None)
+        return node
+
+def optimize(program: AST) -> AST:
+    return Optimizer(numeric_names(program)).optimize(program)
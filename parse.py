@@ -1,10 +1,18 @@
 from start import *
+from vm import VM, compile_program, run
+from iterative import eval_iterative
+from cache import ProgramCache
+from optimizer import optimize, count_nodes
+from profiler import Profiler
 import ast
 import argparse
-
-parser = argparse.ArgumentParser()
-parser.add_argument("--filename", type=str)
-args = parser.parse_args()
+import codecs
+import io
+import mmap
+import re
+import sys
+from array import array
+from bisect import bisect_left
 
 class EndOfStream(Exception):
     pass
@@ -14,6 +22,7 @@ class EndOfStream(Exception):
 class Stream:
     source: str
     pos: int
+    newlines: list = field(default=None, repr=False, compare=False)
 
     def from_file(file):
         return Stream(file.read(), 0)
@@ -22,7 +31,7 @@ class Stream:
         return Stream(s, 0)
 
     def next_char(self):
-        if self.pos >= len(self.source):
+        if self.pos >= len(self.source) and not self.read_more():
             raise EndOfStream()
         self.pos = self.pos + 1
         return self.source[self.pos - 1]
@@ -31,6 +40,119 @@ class Stream:
         assert self.pos > 0
         self.pos = self.pos - 1
 
+    # Line and column (both from 1) of a source offset. The offsets of
+    # the newlines are found with one scan the first time it is asked.
+    def line_column(self, offset):
+        if self.newlines is None:
+            self.newlines = [m.start() for m in re.finditer("\n", self.source)]
+        line = bisect_left(self.newlines, offset)
+        line_start = self.newlines[line - 1] + 1 if line else 0
+        return line + 1, offset - line_start + 1
+
+    # The whole source is there from the start.
+    def read_more(self):
+        return False
+
+"""
+    FileStream reads its file chunk_size characters at a time, when
+    the lexer runs out of source, and release drops the text the
+    lexer is done with. Offsets are into source as it is now; line
+    and column numbers still count from the start of the file.
+"""
+@dataclass
+class FileStream(Stream):
+    file: object = None
+    chunk_size: int = 1 << 16
+    # lines dropped so far, and the column (from 0) source starts at
+    dropped_lines: int = 0
+    column: int = 0
+
+    def from_file(file, chunk_size=1 << 16):
+        return FileStream("", 0, file=file, chunk_size=chunk_size)
+
+    def read_more(self):
+        if self.file is None:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.file = None
+            return False
+        self.source += chunk
+        self.newlines = None
+        return True
+
+    def release(self, upto):
+        done = self.source[:upto]
+        newline = done.rfind("\n")
+        if newline >= 0:
+            self.dropped_lines += done.count("\n")
+            self.column = upto - newline - 1
+        else:
+            self.column += upto
+        self.source = self.source[upto:]
+        self.pos -= upto
+        self.newlines = None
+
+    def line_column(self, offset):
+        line, column = Stream.line_column(self, offset)
+        if line == 1:
+            column += self.column
+        return line + self.dropped_lines, column
+
+"""
+    MappedStream is a FileStream over a memory map of the file, with
+    chunk_size counted in bytes. A chunk is decoded from the map only
+    when the lexer runs out of source (the UTF-8 decoder copies ASCII
+    text straight through), with newlines translated as open() does,
+    and release gives the pages before source back, so the mapped part
+    of a large file does not stay resident.
+"""
+@dataclass
+class MappedStream(FileStream):
+    data: object = None
+    decoder: object = None
+    # bytes decoded so far, before source, and given back
+    decoded: int = 0
+    released: int = 0
+    advised: int = 0
+
+    # Files that cannot be mapped (empty ones, pipes) are read instead.
+    def from_file(file, chunk_size=1 << 16):
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return FileStream.from_file(file, chunk_size)
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), True)
+        return MappedStream("", 0, chunk_size=chunk_size, data=data, decoder=decoder)
+
+    def read_more(self):
+        data = self.data
+        if data is None:
+            return False
+        if self.decoded >= len(data):
+            self.decoder.decode(b"", True)
+            data.close()
+            self.data = None
+            return False
+        end = self.decoded + self.chunk_size
+        self.source += self.decoder.decode(data[self.decoded:end])
+        self.decoded = min(end, len(data))
+        self.newlines = None
+        return True
+
+    def release(self, upto):
+        done = self.source[:upto]
+        FileStream.release(self, upto)
+        # Short by one byte for each "\r\n" read as "\n", so a page
+        # is given back a little late but never early.
+        self.released += len(done) if done.isascii() else len(done.encode())
+        if self.data is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        pages = self.released - self.released % mmap.PAGESIZE
+        if pages > self.advised:
+            self.data.madvise(mmap.MADV_DONTNEED, self.advised, pages - self.advised)
+            self.advised = pages
+
 # Defining  the token types.
 @dataclass
 class Num:
@@ -132,113 +254,123 @@ def word_to_token(word):
 class TokenError(Exception):
     pass
 
+"""
+    The lexer is driven by one compiled pattern. Each token kind is a
+    named group, tried after skipping whitespace, and token_builders
+    maps the group that matched to the function building the token.
+    The kinds are told apart by their first character, in the same
+    order the old character by character lexer tested them:
+
+      - bitwise operators, ';' and the braces/punctuation markers,
+      - symbolic operators, two characters when the pair is an
+        operator (a single character operator needs one more
+        character after it, otherwise the source has run out of
+        tokens),
+      - numbers, and words made of letters; a word may have a
+        '.method' suffix, in which case a whitespace character
+        following the method name is consumed as well,
+      - list literals up to the next ']' and strings up to the next
+        quote,
+      - any other character gives a None token.
+"""
+
+letter = r"[^\W\d_]"
+operator_pattern = "|".join(re.escape(op) for op in sorted(
+    {op for op in symbolic_operators + unary_operators + double_operators if op[0] in symbolic_operators},
+    key=len, reverse=True))
+
+leading_space = re.compile(r"[ \t\n]*")
+
+token_pattern = re.compile(rf"""
+    [ \t\n]*+
+    (?:
+        (?P<bitwise>[&|^])
+      | (?P<end>;)
+      | (?P<marker>[(),{{}}])
+      | (?P<operator>{operator_pattern})
+      | (?P<num>\d+)
+      | (?P<word>{letter}+(?:\.{letter}*)?)
+      | (?P<list>\[[^\]]*\]?)
+      | (?P<string>"[^"]*"?)
+      | (?P<other>[\s\S])
+    )""", re.VERBOSE)
+
+token_builders = {
+    "bitwise": BitwiseOperator,
+    "end": EndStatement,
+    "marker": Markers,
+    "operator": Operator,
+    "num": lambda text: Num(int(text)),
+    "word": word_to_token,
+    "list": word_to_token,
+    "string": word_to_token,
+    "other": lambda text: None,
+}
+
+# Tokens are never modified once built, so the ones for a given text
+# are shared through the cache. List tokens hold the (mutable) list
+# literal and are built fresh every time.
+uncached_kinds = {"list", "other"}
+
+# Returns the token found at pos (after whitespace), where it starts
+# and the position just past it.
+def scan_token(source, pos, cache):
+    m = token_pattern.match(source, pos)
+    if m is None:
+        raise EndOfTokens
+    kind = m.lastgroup
+    text = m.group(kind)
+    end = m.end()
+    if kind == "operator" and len(text) == 1 and end == len(source):
+        raise EndOfTokens
+    if kind == "word" and "." in text and end < len(source) and source[end].isspace():
+        end += 1
+    token = cache.get(text)
+    if token is None:
+        token = token_builders[kind](text)
+        if kind not in uncached_kinds:
+            cache[text] = token
+    return token, m.start(kind), end
+
+def tokenize(source):
+    cache = {}
+    pos = 0
+    while True:
+        try:
+            token, _, pos = scan_token(source, pos, cache)
+        except EndOfTokens:
+            return
+        yield token
+
+token_cache_size = 4096
+
 # Lexer for getting Tokens from sequence of characters
 @dataclass
 class Lexer:
     stream: Stream
     save: Token = None
+    cache: dict = field(default_factory=dict, repr=False)
+    # where the last token read starts
+    start: int = 0
 
     def from_stream(s):
         return Lexer(s)
 
     def next_token(self) -> Token:
-        
-        try:
-            
-            match self.stream.next_char():
-                case c if c in Bitwise_Operators: return BitwiseOperator(c)
-                case c if c in end_of_statement: 
-                    return EndStatement(c)
-                case c if c in braces:
-                    return Markers(c)
-                
-                case c if c in symbolic_operators:
-                    
-                    n=c
-                    l=self.stream.next_char()
-                    n+=l
-                    if(n in symbolic_operators or n in unary_operators or n in double_operators):
-                        return Operator(n)
-                    else:
-                        self.stream.unget()
-                        return Operator(c)
-                case c if c.isdigit():
-                    
-                    n = int(c)
-                    while True:
-                        try:
-                            c = self.stream.next_char()
-                            if c.isdigit():
-                                n = n*10 + int(c)
-                            else:
-                                self.stream.unget()
-                                return Num(n)
-                        except EndOfStream:
-                            return Num(n)
-                
-                 
-                
-                case c if c.isalpha():
-                    
-                    s = c
-                    while True:
-                        try:
-                            c = self.stream.next_char()
-                            if (c=='.'):
-                                s=s+c
-
-                                while True:
-                                    try:
-                                        nc=self.stream.next_char()
-                                        if nc.isalpha():
-                                            s=s+nc
-                                        else:
-                                            return word_to_token(s)
-                                    except EndOfStream:
-
-                                        return word_to_token(s)
-
-
-                            elif c.isalpha() or c in list_braces:
-                                s = s + c
-
-
-                            else:
-                                self.stream.unget()
-                                return word_to_token(s)
-                        except EndOfStream:
-                            return word_to_token(s)
-                        
-                case c if c in whitespace:
-                    
-                    return self.next_token()
-                case c if c in starting_braces:
-                    s=c
-                    while True:
-                        try:
-                            c=self.stream.next_char()
-                            s=s+c
-                            if c in ending_braces:
-                                return word_to_token(s)
-
-                        except EndOfStream:
-                            return word_to_token(s)
-
-                case c if c in quotes:
-                    s=c
-                    while True:
-                        try:
-                            c=self.stream.next_char()
-                            s+=c
-                            if c in quotes:
-                                return word_to_token(s)
-
-                        except EndOfStream:
-                            return word_to_token(s)
-
-                        
-        except EndOfStream:
-            raise EndOfTokens
+        stream = self.stream
+        while True:
+            try:
+                token, start, end = scan_token(stream.source, stream.pos, self.cache)
+            except EndOfTokens:
+                if stream.read_more():
+                    continue
+                stream.pos = len(stream.source)
+                raise
+            # A token that runs to the end of the source read so far
+            # may go on in the rest of the file.
+            if end < len(stream.source) or not stream.read_more():
+                self.start, stream.pos = start, end
+                return token
 
     def peek_token(self) -> Token:
         if self.save is not None:
@@ -256,7 +388,42 @@ class Lexer:
         
         if self.peek_token() == expected:
             return self.advance()
-        raise TokenError()
+        raise TokenError(f"expected {expected} at {self.location()}")
+
+    # Consumes the next token if it is the expected one.
+    def accept(self, expected):
+        try:
+            token = self.peek_token()
+        except EndOfTokens:
+            return False
+        if token == expected:
+            self.advance()
+            return True
+        return False
+
+    # mark/reset let the parser back up to an earlier token.
+    def mark(self):
+        return self.stream.pos, self.save, self.start
+
+    def reset(self, mark):
+        self.stream.pos, self.save, self.start = mark
+
+    # Source offset of the next token.
+    def offset(self):
+        return self.start if self.save is not None else self.stream.pos
+
+    def location(self):
+        line, column = self.stream.line_column(self.offset())
+        return f"line {line}, column {column}"
+
+    # Drops the source before the next token from a FileStream, and
+    # the cached tokens once there are many of them.
+    def release(self):
+        upto = self.offset()
+        self.stream.release(upto)
+        self.start -= upto
+        if len(self.cache) > token_cache_size:
+            self.cache.clear()
 
     def __iter__(self):
         return self
@@ -267,13 +434,182 @@ class Lexer:
         except EndOfTokens:
             raise StopIteration
 
+"""
+    TokenArray lexes the whole source up front. Token kinds are kept
+    as small ints in an array with their values in a side table, so
+    matching an expected token compares a kind and a value instead of
+    going through the dataclass __eq__. The parser walks the array by
+    index: mark() is just the current index and reset() jumps back to
+    it, so any amount of lookahead is cheap.
+
+    The built tokens are kept as well since the parser pattern matches
+    on them. TokenArray has the same interface as Lexer and the two
+    can be used interchangeably.
+"""
+
+token_kinds = {
+    Num: 0,
+    Bool: 1,
+    Keyword: 2,
+    Identifier: 3,
+    Operator: 4,
+    BitwiseOperator: 5,
+    List: 6,
+    String: 7,
+    Method: 8,
+    Markers: 9,
+    EndStatement: 10,
+}
+NO_TOKEN = len(token_kinds)
+
+def token_value(token):
+    match token:
+        case None:
+            return None
+        case Method(name, Identifier(word)):
+            return name, word
+        case Num(value) | Bool(value) | List(value) | String(value):
+            return value
+        case Keyword(value) | Identifier(value):
+            return value
+        case Operator(value) | BitwiseOperator(value) | EndStatement(value) | Markers(value):
+            return value
+
+@dataclass
+class TokenArray:
+    kinds: array
+    values: list
+    tokens: list
+    offsets: array
+    stream: Stream
+    pos: int = 0
+
+    def from_source(source):
+        kinds = array("B")
+        values = []
+        tokens = []
+        offsets = array("q")
+        add_kind, add_value, add_token, add_offset = kinds.append, values.append, tokens.append, offsets.append
+        match_token = token_pattern.match
+        end = len(source)
+        # text -> (token, kind, value) for the tokens that can be shared
+        entries = {}
+        pos = 0
+        while True:
+            m = match_token(source, pos)
+            if m is None:
+                break
+            kind = m.lastgroup
+            text = m.group(kind)
+            begin = pos
+            pos = m.end()
+            if pos == end and kind == "operator" and len(text) == 1:
+                break
+            add_offset(begin)
+            entry = entries.get(text)
+            if entry is None:
+                token = token_builders[kind](text)
+                entry = (token, NO_TOKEN if token is None else token_kinds[type(token)], token_value(token))
+                if kind not in uncached_kinds:
+                    entries[text] = entry
+            if kind == "word" and "." in text and pos < end and source[pos].isspace():
+                pos += 1
+            add_token(entry[0])
+            add_kind(entry[1])
+            add_value(entry[2])
+        return TokenArray(kinds, values, tokens, offsets, Stream(source, end))
+
+    def from_stream(s):
+        return TokenArray.from_source(s.source[s.pos:])
+
+    # As with Lexer, an unknown character is seen by one peek as None
+    # and skipped after that.
+    def peek_token(self) -> Token:
+        try:
+            token = self.tokens[self.pos]
+        except IndexError:
+            raise EndOfTokens
+        if token is None:
+            self.pos += 1
+        return token
+
+    def advance(self):
+        self.pos += 1
+
+    def is_next(self, expected):
+        pos = self.pos
+        return (self.kinds[pos] == token_kinds[type(expected)]
+                and self.values[pos] == token_value(expected))
+
+    def match(self, expected):
+        self.peek_token()
+        if self.is_next(expected):
+            return self.advance()
+        raise TokenError(f"expected {expected} at {self.location()}")
+
+    def accept(self, expected):
+        try:
+            self.peek_token()
+        except EndOfTokens:
+            return False
+        if self.is_next(expected):
+            self.advance()
+            return True
+        return False
+
+    def mark(self):
+        return self.pos
+
+    def reset(self, mark):
+        self.pos = mark
+
+    # offsets holds where the scan for each token began, before the
+    # whitespace in front of it; the whitespace is skipped here rather
+    # than in from_source.
+    def offset(self):
+        pos = self.pos
+        if pos >= len(self.offsets):
+            return len(self.stream.source)
+        return leading_space.match(self.stream.source, self.offsets[pos]).end()
+
+    def location(self):
+        line, column = self.stream.line_column(self.offset())
+        return f"line {line}, column {column}"
+
+"""
+    Parser methods decorated with spanned set the span of the node they
+    return to the source offsets from its first token to the next
+    token after it. Only parse_expr and parse_call are decorated, which
+    covers every statement and operand; the nodes an operator chain
+    builds inside them (the a*b of a*b+c) have no span of their own.
+"""
+def spanned(parse):
+    def parse_spanned(self, *args):
+        start = self.lexer.offset()
+        node = parse(self, *args)
+        if isinstance(node, Node) and node.span is None:
+            node.span = (start, self.lexer.offset())
+        return node
+    return parse_spanned
+
 @dataclass
 class Parser:
     lexer: Lexer
+    variables: dict = field(default_factory=dict, repr=False)
 
     def from_lexer(lexer):
         return Parser(lexer)
 
+    def from_source(source):
+        return Parser(TokenArray.from_source(source))
+
+    # Variables are immutable, so every use of a name shares one node.
+    def variable(self, name):
+        v = self.variables.get(name)
+        if v is None:
+            v = self.variables[name] = Variable(name)
+        return v
+
     def parse_if(self):
         self.lexer.match(Keyword("if"))
         c = self.parse_expr()
@@ -323,6 +659,12 @@ class Parser:
     def parse_print(self):
         self.lexer.match(Keyword('print'))
         p=self.parse_expr()
+        # The token after the expression ends the print. Some
+        # expressions, like a.length, return without peeking it.
+        try:
+            self.lexer.peek_token()
+        except EndOfTokens:
+            return PrintOp(p)
         self.lexer.advance()
         return PrintOp(p)
     
@@ -330,8 +672,11 @@ class Parser:
     # For inner sequence processing ';' is used.
     
     def parse_seq(self):
+        return Seq(list(self.seq_statements()))
+
+    # The statements of a sequence, each one as soon as it is parsed.
+    def seq_statements(self):
         self.lexer.match(Markers('{'))
-        list=[]
         while True:
             match self.lexer.peek_token():
                 case EndStatement():
@@ -339,15 +684,15 @@ class Parser:
                     continue
                 
                 case Markers('}'):
-                    
-                    if self.lexer.next_token()==EndStatement(";"):
-                        self.lexer.advance()
-                        return Seq(list)
-                        
-                    else: 
-                        return Seq(list)
+                    self.lexer.advance()
+                    self.lexer.accept(EndStatement(";"))
+                    return
                             
+                # An identifier followed by an operator is an assignment,
+                # anything else is parsed again as an expression.
                 case Identifier(var):
+                    mark=self.lexer.mark()
+                    start=self.lexer.offset()
                     self.lexer.match(Identifier(var))
                     val=0
                     
@@ -356,13 +701,32 @@ class Parser:
                             self.lexer.advance()
                             val=self.parse_expr()
                             self.lexer.advance()
-                            list.append(Put(Variable(var),val))
+                            yield Put(self.variable(var),val,span=(start,self.lexer.offset()))
                             continue
+                    self.lexer.reset(mark)
+                    yield self.parse_expr()
+                    continue
                             
                 case _:
-                    list.append(self.parse_expr())  
+                    yield self.parse_expr()
                     continue              
 
+    # The statements of a program in { ... } one at a time, for a
+    # lexer over a FileStream. Statements there do not share names,
+    # so once one is parsed the source and the variables read before
+    # it are dropped. Any other program is one statement.
+    def statements(self):
+        try:
+            if self.lexer.peek_token() != Markers("{"):
+                yield self.parse_expr()
+                return
+        except EndOfTokens:
+            return
+        for statement in self.seq_statements():
+            yield statement
+            self.variables.clear()
+            self.lexer.release()
+
 
     # parsing functions in the same way as defined in start1.py
     # defining the function in this also allows for recursive
@@ -383,7 +747,7 @@ class Parser:
                         match self.lexer.peek_token():
                             case Identifier(I):
                                 self.lexer.advance()
-                                parameters.append(Variable(I))
+                                parameters.append(self.variable(I))
                             case Markers(','):
                                 self.lexer.advance()
                             
@@ -418,28 +782,28 @@ class Parser:
             
     def parse_length(self,m):
         self.lexer.match(Method('length',Identifier(m.identifier.word)))
-        return ListOp('length',Variable(m.identifier.word))
+        return ListOp('length',self.variable(m.identifier.word))
     
     def parse_append(self,m):
         self.lexer.match(Method('append',Identifier(m.identifier.word)))
         val= self.parse_atom()
-        return ListOp('append',Variable(m.identifier.word),val)
+        return ListOp('append',self.variable(m.identifier.word),val)
     
     def parse_get(self,m):
         self.lexer.match(Method('get',Identifier(m.identifier.word)))
         idx= self.parse_atom()
-        return ListOp('get',Variable(m.identifier.word),idx)
+        return ListOp('get',self.variable(m.identifier.word),idx)
     
     def parse_assignment(self,m):
         self.lexer.match(Method('assign',Identifier(m.identifier.word)))
         idx= self.parse_atom()
         val=self.parse_atom()
-        return ListOp('assign',Variable(m.identifier.word),idx,val)
+        return ListOp('assign',self.variable(m.identifier.word),idx,val)
     
     def parse_concat(self,m):
         self.lexer.match(Method('concat',Identifier(m.identifier.word)))
         next_str=self.parse_atom()
-        return StringOp('add',Variable(m.identifier.word),next_str)
+        return StringOp('add',self.variable(m.identifier.word),next_str)
     
     def parse_slice(self,m):
         self.lexer.match(Method('slice',Identifier(m.identifier.word)))
@@ -447,7 +811,7 @@ class Parser:
         stop=self.parse_atom()
         step=self.parse_atom()
 
-        return StringSlice('slice',Variable(m.identifier.word),start,stop,step)
+        return StringSlice('slice',self.variable(m.identifier.word),start,stop,step)
 
 
 
@@ -456,7 +820,7 @@ class Parser:
         self.lexer.match(Method('len',Identifier(m.identifier.word)))
 
 
-        return ListOp('length',Variable(m.identifier.word))
+        return ListOp('length',self.variable(m.identifier.word))
 
     def parse_atom(self):
         match self.lexer.peek_token():
@@ -465,7 +829,7 @@ class Parser:
                 return Operator(value)
             case Identifier(name):
                 self.lexer.advance()
-                return Variable(name)
+                return self.variable(name)
             case Num(value):
                 self.lexer.advance()
                 return NumLiteral(value)
@@ -483,6 +847,7 @@ class Parser:
         return For(c,u,b)
     
     
+    @spanned
     def parse_call(self):
         fn=self.parse_atom()
         
@@ -625,6 +990,7 @@ class Parser:
 
         
 
+    @spanned
     def parse_expr(self):
         match self.lexer.peek_token():
             case Keyword("let"):
@@ -675,10 +1041,102 @@ class Parser:
             case _:
                 return self.parse_simple()
 
-with open(args.filename) as f:
-    stream = Stream.from_file(f)
-    lexer = Lexer(stream)
-    parser = Parser.from_lexer(lexer)
-    ast = Parser.parse_expr(parser)
-    eval(ast)
-    f.close()
+# The vm engine keeps its compiled code in the cache, the other
+# engines the parsed (and optimized) AST.
+def front_end(source, engine, optimized=True, report=False):
+    return prepare(Parser.from_source(source).parse_expr(), engine, optimized, report)
+
+def prepare(program, engine, optimized=True, report=False):
+    if optimized:
+        before = count_nodes(program)
+        program = optimize(program)
+        if report:
+            after = count_nodes(program)
+            print(f"optimizer: {before} -> {after} nodes, {before - after} eliminated", file=sys.stderr)
+    if engine == "vm":
+        return compile_program(program)
+    return program
+
+def load_program(filename, source, engine, use_cache=True, optimized=True):
+    if not use_cache:
+        return front_end(source, engine, optimized)
+    cache = ProgramCache.for_file(filename)
+    kind = "code" if engine == "vm" else "ast"
+    key = cache.key(source, kind if optimized else kind + "-unoptimized")
+    program = cache.get(key)
+    if program is None:
+        program = front_end(source, engine, optimized)
+        cache.put(key, program)
+    return program
+
+def run_program(program, engine):
+    if engine == "vm":
+        VM().execute(program)
+    elif engine == "closure":
+        compile_to_closures(program)()
+    elif engine == "iterative":
+        eval_iterative(program)
+    else:
+        eval(program)
+
+# Runs the statements of the program in file as they are parsed (see
+# Parser.statements). On a terminal what each one prints is shown
+# before the next is read.
+def run_stream(file, engine, optimized=True, chunk_size=1 << 16):
+    parser = Parser(Lexer(MappedStream.from_file(file, chunk_size)))
+    interactive = output.fd is None and sys.stdout.isatty()
+    for statement in parser.statements():
+        run_program(prepare(statement, engine, optimized), engine)
+        if interactive:
+            output.flush()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str)
+    parser.add_argument("--engine", choices=["vm", "closure", "eval", "iterative"], default="vm")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse and compile, without reading or writing __thcache__")
+    parser.add_argument("--no-optimize", action="store_true",
+                        help="run the program as parsed, without constant folding")
+    parser.add_argument("--optimizer-report", action="store_true",
+                        help="print how many AST nodes the optimizer removed (skips the cache)")
+    parser.add_argument("--profile", action="store_true",
+                        help="run with eval and print the time spent per node type, operator and line")
+    parser.add_argument("--output", type=str,
+                        help="write what the program prints to this file instead of stdout")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse and run the statements of a top level { ... } one at a time (skips the cache)")
+    args = parser.parse_args()
+    if args.stream and (args.profile or args.optimizer_report):
+        parser.error("--stream cannot be used with --profile or --optimizer-report")
+    if args.profile:
+        args.engine = "eval"
+
+    if args.output:
+        output.to_file(args.output)
+    output.limit = output_buffer
+    profiler = None
+    try:
+        if args.stream:
+            with open(args.filename) as f:
+                run_stream(f, args.engine, not args.no_optimize)
+            return
+        with open(args.filename) as f:
+            source = f.read()
+        if args.optimizer_report:
+            program = front_end(source, args.engine, not args.no_optimize, report=True)
+        else:
+            program = load_program(args.filename, source, args.engine, not args.no_cache, not args.no_optimize)
+        if args.profile:
+            profiler = Profiler(line_of=Stream(source, 0).line_column)
+            profiler.run(program)
+        else:
+            run_program(program, args.engine)
+    finally:
+        output.close()
+        if profiler:
+            profiler.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from dataclasses import dataclass, field
+from time import perf_counter
+import sys
+
+import start
+
+"""
+    Profiler for eval. While Profiler.run is evaluating a program the
+    module level start.eval, which eval calls for every child node, is
+    swapped for a wrapper that times each call; outside of run eval is
+    the plain function, so there is no cost when profiling is off.
+    start.make_function is swapped too, for one that leaves every
+    function to eval: the functions eval would compile to closures
+    and memoize then show up node by node, with the calls eval
+    makes when it does not compile them.
+
+    For every node class and every (class, operator) pair it counts
+    the calls and accumulates the inclusive time (the node and all it
+    evaluated) and the exclusive time (inclusive minus the time of the
+    child nodes). Loop conditions that eval reads directly from the
+    environment are not separate calls; their time is in the loop's
+    exclusive time.
+
+    Given line_of, a function from a source offset to (line, column)
+    such as Stream.line_column, it also keeps the same figures per
+    source line. A node is put on the line its span starts on; nodes
+    without a span (variables and the inner nodes of an operator
+    chain) count toward the line of the nearest enclosing node that
+    has one.
+"""
+
+def interpreted_function(name, params, body):
+    return start.FnObject(params, body)
+
+@dataclass
+class Stats:
+    calls: int = 0
+    inclusive: float = 0.0
+    exclusive: float = 0.0
+
+@dataclass
+class Profiler:
+    by_class: dict = field(default_factory=dict)
+    by_operator: dict = field(default_factory=dict)
+    by_line: dict = field(default_factory=dict)
+    line_of: object = None
+
+    def record(self, table, key, inclusive, exclusive):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = Stats()
+        stats.calls += 1
+        stats.inclusive += inclusive
+        stats.exclusive += exclusive
+
+    def run(self, program, environment=None):
+        original = start.eval
+        original_make_function = start.make_function
+        # children[-1] sums the time of the calls made by the node
+        # currently being evaluated.
+        children = []
+        # lines[-1] is the line of the node currently being evaluated.
+        lines = [None]
+        line_of = self.line_of
+
+        def profiled(program, environment=None):
+            children.append(0.0)
+            line = lines[-1]
+            if line_of is not None:
+                span = getattr(program, "span", None)
+                if span is not None:
+                    line = line_of(span[0])[0]
+            lines.append(line)
+            begin = perf_counter()
+            try:
+                return original(program, environment)
+            finally:
+                elapsed = perf_counter() - begin
+                exclusive = elapsed - children.pop()
+                lines.pop()
+                if children:
+                    children[-1] += elapsed
+                name = type(program).__name__
+                self.record(self.by_class, name, elapsed, exclusive)
+                operator = getattr(program, "operator", None)
+                if isinstance(operator, str):
+                    self.record(self.by_operator, f"{name} {operator}", elapsed, exclusive)
+                if line is not None:
+                    self.record(self.by_line, line, elapsed, exclusive)
+
+        start.eval = profiled
+        start.make_function = interpreted_function
+        try:
+            return profiled(program, environment)
+        finally:
+            start.eval = original
+            start.make_function = original_make_function
+
+    def report(self, file=sys.stderr, limit=20):
+        tables = [("node", self.by_class), ("operator", self.by_operator)]
+        if self.by_line:
+            tables.append(("line", self.by_line))
+        for title, table in tables:
+            print(f"{title:<24}{'calls':>10}{'inclusive':>12}{'exclusive':>12}{'per call':>12}", file=file)
+            rows = sorted(table.items(), key=lambda item: item[1].exclusive, reverse=True)
+            for key, stats in rows[:limit]:
+                per_call = stats.exclusive / stats.calls * 1e6
+                print(f"{str(key):<24}{stats.calls:>10}{stats.inclusive:>11.3f}s{stats.exclusive:>11.3f}s{per_call:>10.1f}us",
+                      file=file)
+            print(file=file)
@@ -1,6 +1,10 @@
 from fractions import Fraction
+import operator
 from dataclasses import dataclass,field
 from typing import Optional, NewType, Mapping, List
+from array import array
+import os
+import sys
 
 currentID = 0
 
@@ -42,56 +46,132 @@ class FracType:
 
 SimType = NumType | BoolType | StringType | ListType | IntType | FracType | VarType
 
+"""
+    Numeric tower. Numbers stay Python ints until a division (or a
+    negative power) has a non-integral result, which becomes a
+    Fraction. A Fraction that comes out integral is turned back into
+    an int so the arithmetic after it goes back to the int fast path.
+"""
+
+def number(value):
+    if type(value) is Fraction and value.denominator == 1:
+        return value.numerator
+    return value
+
+# Sums, differences and products of Fractions can be integral too.
+def add(left, right):
+    value = left + right
+    return number(value) if type(value) is Fraction else value
+
+def subtract(left, right):
+    value = left - right
+    return number(value) if type(value) is Fraction else value
+
+def multiply(left, right):
+    value = left * right
+    return number(value) if type(value) is Fraction else value
+
+def divide(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        if left % right == 0:
+            return left // right
+        return Fraction(left, right)
+    return number(left / right)
+
+def power(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        if right < 0:
+            return number(Fraction(left) ** right)
+        return left ** right
+    return number(left ** right)
+
 """
     Defining the structure of data types, conditionals, unary and 
     binary operators and loops.
 """
 
-@dataclass
-class NumLiteral:
-    value: Fraction
+"""
+    Node is the base of the AST node classes. span holds the (start,
+    end) source offsets of a node the parser built, None otherwise.
+    It is keyword only and left out of equality, so building nodes
+    positionally and matching them works as before. Variables are not
+    Nodes: they are shared between all the uses of a name.
+"""
+@dataclass(slots=True)
+class Node:
+    span: Optional[tuple] = field(default=None, kw_only=True, compare=False, repr=False)
+
+@dataclass(slots=True)
+class NumLiteral(Node):
+    value: Fraction = 0
     type: SimType = NumType
-    # def __init__(self, *args):
-    #     self.value = Fraction(*args)
 
-@dataclass 
-class IntLiteral:
+    def __post_init__(self):
+        self.value = number(self.value)
+
+@dataclass(slots=True)
+class IntLiteral(Node):
     value: int
     type: SimType=IntType
     def __init__(self, *args):
         self.value = int(*args)
+        self.type = IntType
+        self.span = None
 
-@dataclass 
-class FracLiteral:
+@dataclass(slots=True)
+class FracLiteral(Node):
     value: Fraction
     type: SimType=FracType
     def __init__(self, *args):
         self.value = Fraction(*args)
+        self.type = FracType
+        self.span = None
 
-@dataclass
-class BoolLiteral:
+@dataclass(slots=True)
+class BoolLiteral(Node):
     value: bool
     type: SimType =BoolType
 
-@dataclass
-class StringLiteral:
+@dataclass(slots=True)
+class StringLiteral(Node):
     value: str
     type: SimType=StringType
     
 
-@dataclass
-class BinOp:
+"""
+    Binary operators are interned to small integer opcodes when a BinOp
+    is built. The first pure_binary_count of them just apply their
+    function from binary_functions to both operands, which lets eval
+    handle them with one table lookup; the VM numbers BINARY_OP the
+    same way.
+"""
+binary_operators = "+ - * ** == != < > <= >= / // % & | ^ >> << concat +=".split()
+binary_opcodes = {op: code for code, op in enumerate(binary_operators)}
+pure_binary_count = 10
+unknown_opcode = len(binary_operators)
+
+@dataclass(slots=True)
+class BinOp(Node):
     operator: str
     left: 'AST'
     right: 'AST'
     type: Optional[SimType] = None
+    opcode: int = field(default=unknown_opcode, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.opcode = binary_opcodes.get(self.operator, unknown_opcode)
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Variable:
     name: str
     # id: int
     # localID:int
     type: SimType = VarType
+    # Filled in by resolve: how many function frames up the binding
+    # lives and its index in that frame. Not part of equality, so
+    # Environment lookups ignore them.
+    depth: Optional[int] = field(default=None, compare=False)
+    slot: Optional[int] = field(default=None, compare=False)
 
 
     # def make(name):
@@ -99,38 +179,38 @@ class Variable:
 
     
 
-@dataclass
-class UnOp:
+@dataclass(slots=True)
+class UnOp(Node):
     operator: str
     vari : int
 
-@dataclass
-class LogOp:
+@dataclass(slots=True)
+class LogOp(Node):
     operator: str
     left: 'AST'
     right: Optional['AST']= None
     type: Optional[SimType] = None 
 
-@dataclass
-class PrintOp:
+@dataclass(slots=True)
+class PrintOp(Node):
     inp: 'AST'
 
 
-@dataclass
-class StringOp:
+@dataclass(slots=True)
+class StringOp(Node):
     operator:str
     left:'AST'
     right:Optional['AST']=None
     type:Optional[SimType]=StringType
     
-@dataclass
+@dataclass(slots=True)
 class StringSlice(StringOp):
     start: Optional[int] = None
     stop: Optional[int] = None
     step: Optional[int] = None
     type: Optional[SimType] = StringType
-@dataclass
-class Let:
+@dataclass(slots=True)
+class Let(Node):
     var: 'AST'
     e1: 'AST'
     e2: 'AST'
@@ -139,80 +219,86 @@ class LetGlobal:
     var:'AST'
     e1:'AST'
     e2:Optional['AST']
-@dataclass
-class IfElse:
+@dataclass(slots=True)
+class IfElse(Node):
     condition: 'AST'
     iftrue: 'AST'
     iffalse: 'AST'
     type: Optional[SimType] = None
 
-@dataclass
-class ListLiteral:
+@dataclass(slots=True)
+class ListLiteral(Node):
     list_val:list
     type:SimType=ListType
 
-@dataclass
-class ListOp:
+    def __post_init__(self):
+        self.list_val = typed_list(self.list_val)
+
+@dataclass(slots=True)
+class ListOp(Node):
     operator:str
     left:'AST'
     right:Optional['AST']=None
     assign:Optional['AST']=None
     type:SimType=ListType
 
-@dataclass
-class Get:
+@dataclass(slots=True)
+class Get(Node):
     var: 'AST'
 
-@dataclass
-class Put:
+@dataclass(slots=True)
+class Put(Node):
     var: 'AST'
     e1: 'AST'
 
-@dataclass
-class LetConst:
+@dataclass(slots=True)
+class LetConst(Node):
     var: 'AST'
     e1: 'AST'
     e2: 'AST'
 
-@dataclass
-class Seq:
+@dataclass(slots=True)
+class Seq(Node):
     things: List['AST']
 
-@dataclass
-class Un_boolify:
+@dataclass(slots=True)
+class Un_boolify(Node):
     left:'AST'
     type:SimType=NumType|StringType
 
-@dataclass
-class Whilethen:
+@dataclass(slots=True)
+class Whilethen(Node):
     condition: 'AST'
     then_body: 'AST'
     
 
-@dataclass
-class For:
+@dataclass(slots=True)
+class For(Node):
     condition:'AST'
     update:'AST'
     body:'AST'
 
-@dataclass
-class LetFun:
+@dataclass(slots=True)
+class LetFun(Node):
     name: 'AST'
     params: List['AST']
     body: 'AST'
     expr: 'AST'
+    frame_size: Optional[int] = None
 
-@dataclass
-class FunCall:
+@dataclass(slots=True)
+class FunCall(Node):
     fn: 'AST'
     args: List['AST']
 
-@dataclass
+@dataclass(slots=True)
 class FnObject:
     params: List['AST']
     body: 'AST'
-@dataclass
-class If:
+    frame: Optional[List] = field(default=None, repr=False)
+    frame_size: int = 0
+@dataclass(slots=True)
+class If(Node):
     cond: 'AST'
     body: 'AST'
     type: Optional[SimType] = None
@@ -223,9 +309,13 @@ class If:
 """
 class Environment:
     envs: List
+    checks: dict
+    functions: dict
 
     def __init__(self):
         self.envs = [{}]
+        self.checks = {}
+        self.functions = {}
 
     def enter_scope(self):
         self.envs.append({})
@@ -250,7 +340,26 @@ class Environment:
                 env[name] = value
                 return
         raise KeyError()
-    
+
+    # The operand checks of an operator only depend on the tree, so
+    # each node is checked once per run and the outcome is kept under
+    # its id (with the node itself, so a reused id is not mistaken
+    # for it).
+    def check_once(self, check, node, *operands):
+        entry = self.checks.get(id(node))
+        if entry is None or entry[0] is not node:
+            entry = self.checks[id(node)] = node, static_check(check, *operands)
+        if entry[1] is not None:
+            raise entry[1].with_traceback(None)
+
+    # Like the checks, the function a LetFun defines is built once per
+    # run (see make_function).
+    def function(self, node):
+        entry = self.functions.get(id(node))
+        if entry is None or entry[0] is not node:
+            entry = self.functions[id(node)] = node, make_function(node.name, node.params, node.body)
+        return entry[1]
+
 """
     AST here has the different types of node
     value it can have.
@@ -260,7 +369,7 @@ class Environment:
 """
 
 AST = NumLiteral | BoolLiteral | BinOp | IfElse | StringLiteral | StringOp|LogOp|ListLiteral|IntLiteral|FracLiteral|ListOp| Get | Put |Let | LetConst |Seq | Whilethen |For | Variable|LetFun | FunCall
-Value = Fraction|FnObject
+Value = int|Fraction|FnObject
 TypedAST = NewType('TypedAST', AST)
 
 class TypeError(Exception):
@@ -295,7 +404,6 @@ def typecheck(program: AST, env = None) -> TypedAST:
         case BinOp(op, left, right) if op in   Binary_operators or Binary_operators_comparision:
             tleft = typecheck(left)
             tright = typecheck(right)
-            print(tleft, tright)
             Binop_list_Comp = [NumType, StringType, VarType]
             Binop_list__op = [NumType, VarType]
             if op in Binary_operators:
@@ -392,6 +500,90 @@ def typecheck(program: AST, env = None) -> TypedAST:
 
 
 
+"""
+    What print writes goes through output. Each line is kept until
+    more than limit lines are waiting and then written with the others
+    in one call, so a loop that prints a line per iteration does not
+    pay for a write (and, on a terminal, a flush) each time. The limit
+    is 0 unless a caller sets it, so every line is written straight
+    away; parse.py keeps up to output_buffer lines and flushes at the
+    end of the program, also when it fails.
+
+    Lines go to sys.stdout as it is when they are written, or with
+    to_file, encoded straight to the file descriptor of a file.
+"""
+
+output_buffer = 4096
+
+class Output:
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.fd = None
+        self.lines = []
+
+    def write(self, value):
+        lines = self.lines
+        lines.append(f"{value}")
+        if len(lines) > self.limit:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        self.lines.append("")
+        text = "\n".join(self.lines)
+        self.lines.clear()
+        if self.fd is None:
+            sys.stdout.write(text)
+            return
+        data = memoryview(text.encode())
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    def to_file(self, path):
+        self.flush()
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    # Writes what is left and goes back to writing every line to
+    # sys.stdout.
+    def close(self):
+        self.flush()
+        self.limit = 0
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+output = Output()
+
+"""
+    Loop conditions are evaluated on every iteration. The usual shape,
+    a comparison between variables and literals, gets a function that
+    reads the variables straight from the environment; anything else
+    goes through eval.
+"""
+
+def operand_reader(program, environment):
+    match program:
+        case Variable():
+            get = environment.get
+            return lambda: get(program)
+        case NumLiteral(value) | BoolLiteral(value) | StringLiteral(value):
+            return lambda: value
+    return lambda: eval(program, environment)
+
+def loop_test(condition, environment):
+    match condition:
+        case BinOp(left=Variable() as v, right=NumLiteral(value), opcode=opcode) if opcode < pure_binary_count:
+            compare = pure_binary_table[opcode]
+            get = environment.get
+            return lambda: compare(get(v), value)
+        case BinOp(left=left, right=right, opcode=opcode) if opcode < pure_binary_count:
+            compare = pure_binary_table[opcode]
+            read_left = operand_reader(left, environment)
+            read_right = operand_reader(right, environment)
+            return lambda: compare(read_left(), read_right())
+    return lambda: eval(condition, environment)
+
 """
     Defining an exception to raise in case of Invalid Program.
 """
@@ -409,11 +601,9 @@ def eval(program: AST, environment: Environment = None) -> Value:
     if environment is None:
         environment =Environment()
     
-    # Pass environment to all explicitally
-    def eval2(program):
-        return eval(program, environment)
-    
-    # always call eval2 for enviornment passing instead of eval(program, envi)
+    # Children are evaluated by calling eval again with the same
+    # environment, through the module level name (see profiler.py),
+    # so evaluating a node allocates nothing of its own.
     match program:
 
         # Here the value of data types
@@ -445,27 +635,27 @@ def eval(program: AST, environment: Environment = None) -> Value:
         # it cannot be redefined.
 
         case Let(Variable(_) as v, e1, e2):
-            v1 = eval2(e1)
+            v1 = eval(e1, environment)
             environment.enter_scope()
             environment.add(v, v1)
-            v2 = eval2(e2)
+            v2 = eval(e2, environment)
             environment.exit_scope()
             return v2
          
         case LetConst(Variable(name),e1,e2):
-            v1 = eval2(e1)
+            v1 = eval(e1, environment)
             if(environment.check(name) != None):
-                print("Variable name exists")
+                output.write("Variable name exists")
                 raise InvalidProgram()
             environment.enter_scope()
             environment.add(name,v1)
-            v2 = eval2(e2)
+            v2 = eval(e2, environment)
             environment.exit_scope()
             return v2
         
         # Put is used to update value of the variable
         case Put(Variable(_) as v, e):
-            environment.update(v, eval2(e))
+            environment.update(v, eval(e, environment))
             return environment.get(v)
         
         # Get is used to retreive the value of the variable
@@ -474,205 +664,134 @@ def eval(program: AST, environment: Environment = None) -> Value:
         case Seq(things):
             v = None
             for thing in things:
-                v = eval2(thing)
+                v = eval(thing, environment)
             return v
         
-        # Binary Operators
-        case BinOp("+", left, right):
-            return eval2(left) + eval2(right)
-        case BinOp("-", left, right):
-            return eval2(left) - eval2(right)
-        case BinOp("*", left, right):
-            return eval2(left) * eval2(right )
+        # Binary Operators; + - * ** and the comparisons go
+        # through their opcode
+        case BinOp(left=left, right=right, opcode=opcode) if opcode < pure_binary_count:
+            return pure_binary_table[opcode](eval(left, environment), eval(right, environment))
         case BinOp("/", left, right):
             if(right==0):
                 raise InvalidProgram()
-            return  eval2(left ) /  eval2(right )
+            return divide(eval(left, environment), eval(right, environment))
             
         case BinOp("//", left, right):
             if(right==0):
                 raise InvalidProgram()
-            return  eval2(left ) //  eval2(right )
+            return  eval(left, environment) //  eval(right, environment)
         case BinOp("%", left, right):
             if(right==0):
                 raise InvalidProgram()
-            return  eval2(left ) %  eval2(right )
-        case BinOp("**", left, right):
-            return  eval2(left ) **  eval2(right )
-        case BinOp("==",left,right):
-            return  eval2(left ) ==  eval2(right )
-        case BinOp("<",left,right):
-            return  eval2(left ) <  eval2(right )
-        case BinOp(">",left,right):
-            return  eval2(left ) >  eval2(right )
-        case BinOp(">=",left,right):
-            return  eval2(left ) >=  eval2(right )
-        case BinOp("<=",left,right):
-            return  eval2(left ) <=  eval2(right )
-        case BinOp("!=",left,right):
-            return  eval2(left ) !=  eval2(right )
-    
+            return  eval(left, environment) %  eval(right, environment)
         # Bitwise Operators With type checking
-        case BinOp("&",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            
-            if(left_type!=NumType or right_type!=NumType):
-                raise InvalidProgram()
-            return int( eval2(left )) & int( eval2(right ))
-        case BinOp("|",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            
-            if(left_type!=NumType or right_type!=NumType):
-                print(left_type)
-                print(right_type)
-                raise InvalidProgram()
-            return int( eval2(left )) | int( eval2(right ))
-        case BinOp("^",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            
-            if(left_type!=NumType or right_type!=NumType):
-                print(left_type) 
-                print(right_type)
-                raise InvalidProgram()
-            return int( eval2(left )) ^ int( eval2(right ))
-        case BinOp(">>",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            
-            if(left_type!=NumType or right_type!=NumType):
-                print(left_type)
-                print(right_type)
-                raise InvalidProgram()
-            return int( eval2(left )) >> int( eval2(right ))
-        case BinOp("<<",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            
-            if(left_type!=NumType or right_type!=NumType):
-                print(left_type)
-                print(right_type)
-                raise InvalidProgram()
-            return int( eval2(left )) << int( eval2(right ))
+        case BinOp("&",left,right) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            return int( eval(left, environment)) & int( eval(right, environment))
+        case BinOp("|",left,right) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            return int( eval(left, environment)) | int( eval(right, environment))
+        case BinOp("^",left,right) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            return int( eval(left, environment)) ^ int( eval(right, environment))
+        case BinOp(">>",left,right) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            return int( eval(left, environment)) >> int( eval(right, environment))
+        case BinOp("<<",left,right) as node:
+            environment.check_once(check_bitwise, node, left, right)
+            return int( eval(left, environment)) << int( eval(right, environment))
         
         # Addition Assignment Operator
-        case BinOp("+=",left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            rtype=[NumType,VarType]
-            if(left_type!=VarType or right_type not in rtype):
+        case BinOp("+=",left,right) as node:
+            environment.check_once(check_add_assign, node, left, right)
+            if not isinstance(left, Variable):
                 raise InvalidProgram()
-            val=eval2(Get(left))
-            new_val=val+(eval2(right))
-            eval2(Put(left,NumLiteral(new_val)))
-            return eval2(NumLiteral(new_val))
+            val = environment.get(left)
+            new_val = number(val + eval(right, environment))
+            environment.update(left, new_val)
+            return new_val
 
         case PrintOp(inp):
-            print(eval2(inp))
+            output.write(eval(inp, environment))
             return 
   
         # String Operations
         # with string typecheck 
 
-        case StringOp('add',left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            types=[VarType,StringType]
-            if(left_type not in types or right_type not in types):
-                raise InvalidProgram()
-            return  f"{eval2(left )}{eval2(right )}"
+        case StringOp('add',left,right) as node:
+            environment.check_once(check_concat, node, left, right)
+            left_value = eval(left, environment)
+            return concat(left_value, eval(right, environment))
         
-        case StringOp('compare',left,right):
-            left_type=typecheck(left).type
-            right_type=typecheck(right).type
-            if(left_type!=StringType or right_type!=StringType):
-                raise InvalidProgram()
-            return eval2(BoolLiteral(eval2(left)==eval2(right)))
+        case StringOp('compare',left,right) as node:
+            environment.check_once(check_compare, node, left, right)
+            return eval(left, environment) == eval(right, environment)
 
-        case StringOp('length',left):
-            left_type=typecheck(left).type
-            if(left_type!=StringType):
-                raise InvalidProgram()
-            return len(eval2(left))        
+        case StringOp('length',left) as node:
+            environment.check_once(check_length, node, left)
+            return len(eval(left, environment))        
 
         case StringSlice("slice", left,start, stop,step):
-            left_value =  eval2(left )
-            return left_value[eval2(start):eval2(stop):eval2(step)]
+            left_value =  eval(left, environment)
+            return slice_text(left_value, eval(start, environment), eval(stop, environment), eval(step, environment))
         
 
         #unary Operations including unary negation, addition, subtraction
-        case UnOp('-',vari):
-            un= eval2(vari )
-            un=-un
-            eval2(Put(vari,NumLiteral(un)))
-            return  eval2(NumLiteral(un) )
-        case UnOp('++',vari):
-            un= eval2(vari )
-            un=un+1
-            eval2(Put(vari,NumLiteral(un)))
-            return  eval2(NumLiteral(un) )
-        case UnOp('--',vari):
-            un= eval2(vari )
-            un=un-1
-            eval2(Put(vari,NumLiteral(un)))
-            return  eval2(NumLiteral(un) )
+        # The operand is evaluated before it is checked to be a
+        # variable the result can be stored in.
+        case UnOp('-' | '++' | '--' as op, vari):
+            un = number(unary_functions[op](eval(vari, environment)))
+            if not isinstance(vari, Variable):
+                raise InvalidProgram()
+            environment.update(vari, un)
+            return un
         
         case LogOp("and",left,right):
-            return eval2(left ) and eval2(right)
+            return eval(left, environment) and eval(right, environment)
         case LogOp("or",left,right):
-            return eval2(left ) or eval2(right)
+            return eval(left, environment) or eval(right, environment)
         case LogOp("not",right):
-            return not eval2(right)
+            return not eval(right, environment)
         
 
     
         #Only If
         case If(c,b):
-            condition_eval= eval2(c)
+            condition_eval= eval(c, environment)
             if(condition_eval==True):
-                return  eval2(b)
+                return  eval(b, environment)
             else:
                 return 
 
         # IfElse
         case IfElse(c,l,r):
         
-            condition_eval= eval2(c)
+            condition_eval= eval(c, environment)
 
             if(condition_eval==True):
-                return  eval2(l)
+                return  eval(l, environment)
             else:
-                return  eval2(r)
+                return  eval(r, environment)
         
         # List Operations 
 
         case ListOp("append",left,right):
-            
-            
-            l= eval2(left)
-            r= eval2(right)
-            if(type(r)==Fraction):
-                l.append(int(r))
-            else:
-                l.append(r)
-            return l
+            l= eval(left, environment)
+            return list_append(l, eval(right, environment))
             
 
         case ListOp('length',left):
-            return len( eval2(left))
+            return len( eval(left, environment))
 
         case ListOp('assign',array,index,assign):
             # if(typecheck(assign).type!=array.type or typecheck(index).type!=NumType):
             #     raise InvalidProgram
-            arr= eval2(array)
-            
-            arr[int( eval2(index))]=int( eval2(assign))
-            return arr
+            arr= eval(array, environment)
+            value = eval(assign, environment)
+            return list_assign(arr, eval(index, environment), value)
         
         case ListOp('remove',array):
-            arr= eval2(array)
+            arr= eval(array, environment)
             arr.pop()
             return arr
 
@@ -680,19 +799,17 @@ def eval(program: AST, environment: Environment = None) -> Value:
         case ListOp('remove',array,index):
             if(index!=NumType):
                 raise InvalidProgram
-            arr= eval2(arr)
+            arr= eval(arr, environment)
 
         case ListOp('pop',array,index):
             if(index!=NumType):
                 raise InvalidProgram
-            arr= eval2(array)
+            arr= eval(array, environment)
             arr.remove(index)
             return arr
         case ListOp('get',array,index):
-
-            if(int(eval2(index))>=len(eval2(array))): raise InvalidProgram()
-
-            return eval2(array)[int(eval2(index))]
+            arr = eval(array, environment)
+            return list_get(arr, eval(index, environment))
         
 
         case Un_boolify(left):
@@ -707,45 +824,51 @@ def eval(program: AST, environment: Environment = None) -> Value:
         
         # For Loop and While Loop 
         
+        # Nothing binds a name in the scope it runs in (Let, LetFun
+        # and calls open their own), so a scope opened by the loop
+        # would always stay empty: loops run in the enclosing scope.
         case For(condition, update, body):
-            while eval2(condition):
-                environment.enter_scope()
-                eval2(body)
-                eval2(update)
-                environment.exit_scope()
+            test = loop_test(condition, environment)
+            while test():
+                eval(body, environment)
+                eval(update, environment)
             return
         
         case Whilethen(condition,then_body):
-            environment.enter_scope()
-            condi = eval2(condition)
-            while(condi == True):
-                eval2(then_body)
-                condi = eval2(condition)
-                if(condi == False):
-                    break
-            environment.exit_scope()
+            test = loop_test(condition, environment)
+            while test() == True:
+                eval(then_body, environment)
             return
         
         # Functions are defined such that there are two 
         # Classes one for defining(LetFun) the functions with all its
         # parameters and body while other(FunCall) is used for calling it.
 
-        case LetFun(Variable(_) as v, params, body, expr):
+        case LetFun(Variable(_) as v, params, body, expr) as node:
             environment.enter_scope()
-            environment.add(v, FnObject(params, body))
-            v = eval2(expr)
+            environment.add(v, environment.function(node))
+            v = eval(expr, environment)
             environment.exit_scope()
             return v
         
+        # A function compiled by make_function has a frame: the
+        # arguments go into a new frame by position and the compiled
+        # body runs on it. Otherwise the arguments become the call's
+        # scope and the body is evaluated in it.
         case FunCall(Variable(_) as v, args):
             fn = environment.get(v)
             argv = []
             for arg in args:
-                argv.append(eval2(arg))
-            environment.enter_scope()
-            for param, arg in zip(fn.params, argv):
-                environment.add(param, arg)
-            v = eval2(fn.body)
+                argv.append(eval(arg, environment))
+            if len(argv) != len(fn.params):
+                raise InvalidProgram()
+            if fn.frame is not None:
+                call_frame = [None] * fn.frame_size
+                call_frame[0] = fn.frame
+                call_frame[1:1 + len(argv)] = argv
+                return fn.body(call_frame)
+            environment.envs.append(dict(zip(fn.params, argv)))
+            v = eval(fn.body, environment)
             environment.exit_scope()
             return v
            
@@ -754,5 +877,927 @@ def eval(program: AST, environment: Environment = None) -> Value:
     raise InvalidProgram()
 
 
+"""
+    Operator implementations shared by the compiled backends
+    (compile_to_closures here and the bytecode VM in vm.py).
+"""
+
+def bit_and(left, right):
+    return int(left) & int(right)
+
+def bit_or(left, right):
+    return int(left) | int(right)
 
+def bit_xor(left, right):
+    return int(left) ^ int(right)
 
+def shift_right(left, right):
+    return int(left) >> int(right)
+
+def shift_left(left, right):
+    return int(left) << int(right)
+
+def concat(left, right):
+    if type(right) is not str:
+        right = f"{right}"
+    if type(left) is Rope:
+        return left.concat(right)
+    if type(left) is not str:
+        left = f"{left}"
+    if len(left) + len(right) < rope_min:
+        return left + right
+    return Rope([left, right], 2, len(left) + len(right))
+
+def increment(value):
+    return value + 1
+
+def decrement(value):
+    return value - 1
+
+def unboolify(value):
+    if value == 0 or value:
+        return bool(value)
+    len(value)
+    return bool(value)
+
+"""
+    Strings that are built or cut lazily. A LazyText stands in for the
+    str it holds everywhere: it compares, hashes, prints, slices and
+    adds like that text, which its subclass gives by __str__ (joined or
+    copied the first time it is needed, then kept) and __len__ (known
+    without the text).
+
+    Concatenating onto a long string copies it, so a loop that builds a
+    string piece by piece would take quadratic time. From rope_min
+    characters on, concat returns a Rope instead: the first count
+    strings of a pieces list, which ropes built from one another
+    share. Extending the newest rope appends to the list, so building
+    a string of n pieces takes O(n); extending an older one copies its
+    part of the list first.
+
+    A slice of at least view_min characters is a StringView: the
+    source string and the range of its indices in the slice, so
+    cutting it copies nothing. Slicing a view narrows the range. A
+    view keeps its whole source alive. Shorter slices are copied:
+    CPython shares the one character strings, so the loops that read
+    a string one character at a time allocate nothing either way.
+"""
+
+rope_min = 256
+view_min = 64
+
+class LazyText:
+    __slots__ = ()
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __format__(self, spec):
+        return format(str(self), spec)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __getitem__(self, key):
+        return str(self)[key]
+
+    def __eq__(self, other):
+        if isinstance(other, (str, LazyText)):
+            return len(self) == len(other) and str(self) == str(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __lt__(self, other):
+        return str(self) < text_of(other)
+
+    def __le__(self, other):
+        return str(self) <= text_of(other)
+
+    def __gt__(self, other):
+        return str(self) > text_of(other)
+
+    def __ge__(self, other):
+        return str(self) >= text_of(other)
+
+    def __add__(self, other):
+        return str(self) + text_of(other)
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __mul__(self, other):
+        return str(self) * other
+
+    __rmul__ = __mul__
+
+def text_of(value):
+    return str(value) if isinstance(value, LazyText) else value
+
+class Rope(LazyText):
+    __slots__ = ("pieces", "count", "length", "text")
+
+    def __init__(self, pieces, count, length):
+        self.pieces = pieces
+        self.count = count
+        self.length = length
+        self.text = None
+
+    def concat(self, piece):
+        pieces = self.pieces
+        if self.count != len(pieces):
+            pieces = pieces[:self.count]
+        pieces.append(piece)
+        return Rope(pieces, len(pieces), self.length + len(piece))
+
+    # The joined text replaces the pieces, so a rope extended from
+    # this one does not join them again.
+    def __str__(self):
+        if self.text is None:
+            self.text = "".join(self.pieces[:self.count])
+            self.pieces = [self.text]
+            self.count = 1
+        return self.text
+
+    def __len__(self):
+        return self.length
+
+def text_at(source, indices):
+    stop = indices.stop if indices.stop >= 0 else None
+    return source[indices.start:stop:indices.step]
+
+class StringView(LazyText):
+    __slots__ = ("source", "indices", "text")
+
+    def __init__(self, source, indices):
+        self.source = source
+        self.indices = indices
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            self.text = text_at(self.source, self.indices)
+        return self.text
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self.source[self.indices[key]]
+        indices = self.indices[key]
+        if len(indices) < view_min:
+            return text_at(self.source, indices)
+        return StringView(self.source, indices)
+
+def slice_text(value, start, stop, step):
+    if type(value) is Rope:
+        value = str(value)
+    if type(value) is str:
+        indices = range(len(value))[start:stop:step]
+        if len(indices) >= view_min:
+            return StringView(value, indices)
+    return value[start:stop:step]
+
+"""
+    A list whose elements are all ints that fit in 64 bits is kept in
+    an IntList: one mutable object that compares equal to and prints
+    like the plain list with the same elements, holding them in an
+    array("q") (8 bytes per element, where a list of ints above 256
+    takes about 40). Storing a value the array cannot hold (not an
+    int, or too big) moves the elements into a plain list inside the
+    same IntList, so every reference to it sees the store.
+"""
+
+int_list_min, int_list_max = -2**63, 2**63 - 1
+
+def fits_int64(value):
+    return type(value) is int and int_list_min <= value <= int_list_max
+
+def plain_list(items):
+    return items.tolist() if type(items) is array else items
+
+class IntList:
+    __slots__ = ("items",)
+    __hash__ = None
+
+    def __init__(self, values=()):
+        values = list(values)
+        self.items = array("q", values) if all(fits_int64(v) for v in values) else values
+
+    def __reduce__(self):
+        return IntList, (self.tolist(),)
+
+    def tolist(self):
+        return list(self.items)
+
+    def append(self, value):
+        items = self.items
+        if type(items) is array and not fits_int64(value):
+            items = self.items = items.tolist()
+        items.append(value)
+
+    def __setitem__(self, index, value):
+        items = self.items
+        if type(items) is array and not fits_int64(value):
+            items = self.items = items.tolist()
+        items[index] = value
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return IntList(self.items[index])
+        return self.items[index]
+
+    def pop(self, *index):
+        return self.items.pop(*index)
+
+    def remove(self, value):
+        self.items.remove(value)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, value):
+        return value in self.items
+
+    def __eq__(self, other):
+        if type(other) is IntList:
+            other = other.items
+        if isinstance(other, (list, array)):
+            return plain_list(self.items) == plain_list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __add__(self, other):
+        return self.tolist() + (other.tolist() if type(other) is IntList else other)
+
+    def __radd__(self, other):
+        return other + self.tolist()
+
+    def __repr__(self):
+        return repr(plain_list(self.items))
+
+def typed_list(values):
+    if type(values) is list and all(fits_int64(v) for v in values):
+        return IntList(values)
+    return values
+
+# Lists are indexed from 0 to their length - 1: any other index,
+# negative ones included, is an InvalidProgram.
+def list_index(l, index):
+    i = int(index)
+    if not 0 <= i < len(l):
+        raise InvalidProgram()
+    return i
+
+def list_get(l, index):
+    i = list_index(l, index)
+    return l.items[i] if type(l) is IntList else l[i]
+
+def list_append(l, value):
+    if type(value) == Fraction:
+        value = int(value)
+    l.append(value)
+    return l
+
+def list_assign(l, index, value):
+    l[list_index(l, index)] = int(value)
+    return l
+
+binary_functions = {
+    "+": add,
+    "-": subtract,
+    "*": multiply,
+    "/": divide,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "**": power,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "&": bit_and,
+    "|": bit_or,
+    "^": bit_xor,
+    ">>": shift_right,
+    "<<": shift_left,
+    "concat": concat,
+}
+
+unary_functions = {
+    "-": operator.neg,
+    "++": increment,
+    "--": decrement,
+    "not": operator.not_,
+    "length": len,
+    "unboolify": unboolify,
+}
+
+binary_table = [binary_functions.get(op) for op in binary_operators]
+pure_binary_table = binary_table[:pure_binary_count]
+
+Bitwise_operators = "& | ^ >> <<".split()
+Unary_operators = "- ++ --".split()
+
+"""
+    Some operators typecheck their operands before running. The result
+    only depends on the shape of the tree, so eval runs each check once
+    per node (Environment.check_once) and the compiled backends once at
+    compile time, raising the resulting error in place of the operation
+    when it fails.
+"""
+
+def check_bitwise(left, right):
+    left_type = typecheck(left).type
+    right_type = typecheck(right).type
+    if left_type != NumType or right_type != NumType:
+        raise InvalidProgram()
+
+def check_add_assign(left, right):
+    left_type = typecheck(left).type
+    right_type = typecheck(right).type
+    if left_type != VarType or right_type not in [NumType, VarType]:
+        raise InvalidProgram()
+
+def check_concat(left, right):
+    left_type = typecheck(left).type
+    right_type = typecheck(right).type
+    types = [VarType, StringType]
+    if left_type not in types or right_type not in types:
+        raise InvalidProgram()
+
+def check_compare(left, right):
+    left_type = typecheck(left).type
+    right_type = typecheck(right).type
+    if left_type != StringType or right_type != StringType:
+        raise InvalidProgram()
+
+def check_length(left):
+    if typecheck(left).type != StringType:
+        raise InvalidProgram()
+
+def static_check(check, *operands):
+    try:
+        check(*operands)
+    except Exception as error:
+        return error
+    return None
+
+"""
+    Lexical addressing for the compiled backends.
+
+    A frame is a Python list holding the variables of one function
+    activation (or of the whole program): frame[0] links to the frame
+    the function was defined in and every Let, LetConst, LetFun and
+    parameter gets its own slot after that. resolve returns a copy of
+    the program where each Variable, including the ones inside Put,
+    Get and the binding sites, carries the number of frames to walk
+    up (depth) and its slot index, so a lookup is an index operation
+    however deeply the lets are nested.
+
+    Function bodies see the bindings in scope where the function was
+    defined. eval looks free variables up in the caller's scopes
+    instead, which only differs when a caller shadows a name that the
+    function body uses.
+"""
+
+class FrameLayout:
+
+    def __init__(self):
+        self.scopes = [{}]
+        self.size = 1
+
+class Resolver:
+
+    def __init__(self):
+        self.layouts = [FrameLayout()]
+
+    def enter_scope(self):
+        self.layouts[-1].scopes.append({})
+
+    def exit_scope(self):
+        self.layouts[-1].scopes.pop()
+
+    def declare(self, v):
+        layout = self.layouts[-1]
+        slot = layout.size
+        layout.size += 1
+        layout.scopes[-1][v.name] = slot
+        return Variable(v.name, v.type, 0, slot)
+
+    # Names with no binding in scope are left unresolved and raise
+    # KeyError when they are evaluated, like in Environment.
+    def lookup(self, v):
+        for depth, layout in enumerate(reversed(self.layouts)):
+            for scope in reversed(layout.scopes):
+                if v.name in scope:
+                    return Variable(v.name, v.type, depth, scope[v.name])
+        return v
+
+    def resolve(self, program):
+        r = self.resolve
+        match program:
+            case Variable():
+                return self.lookup(program)
+            case Let(Variable() as v, e1, e2, t):
+                e1 = r(e1)
+                self.enter_scope()
+                v = self.declare(v)
+                e2 = r(e2)
+                self.exit_scope()
+                return Let(v, e1, e2, t)
+            case LetConst(Variable() as v, e1, e2):
+                e1 = r(e1)
+                self.enter_scope()
+                v = self.declare(v)
+                e2 = r(e2)
+                self.exit_scope()
+                return LetConst(v, e1, e2)
+            case LetFun(Variable() as v, params, body, expr):
+                self.enter_scope()
+                v = self.declare(v)
+                self.layouts.append(FrameLayout())
+                params = [self.declare(p) for p in params]
+                body = r(body)
+                layout = self.layouts.pop()
+                expr = r(expr)
+                self.exit_scope()
+                return LetFun(v, params, body, expr, layout.size)
+            case Put(var, e):
+                return Put(r(var), r(e))
+            case Get(var):
+                return Get(r(var))
+            case Seq(things):
+                return Seq([r(thing) for thing in things])
+            case BinOp(op, left, right, t):
+                return BinOp(op, r(left), r(right), t)
+            case UnOp(op, vari):
+                return UnOp(op, r(vari))
+            case LogOp(op, left, right, t):
+                return LogOp(op, r(left), r(right), t)
+            case PrintOp(inp):
+                return PrintOp(r(inp))
+            case StringSlice():
+                return StringSlice(program.operator, r(program.left), r(program.right), r(program.type),
+                                   r(program.start), r(program.stop), r(program.step))
+            case StringOp(op, left, right, t):
+                return StringOp(op, r(left), r(right), t)
+            case If(c, b, t):
+                return If(r(c), r(b), t)
+            case IfElse(c, t, f, ty):
+                return IfElse(r(c), r(t), r(f), ty)
+            case ListOp(op, left, right, assign, t):
+                return ListOp(op, r(left), r(right), r(assign), t)
+            case Un_boolify(left, t):
+                return Un_boolify(r(left), t)
+            case For(condition, update, body):
+                return For(r(condition), r(update), r(body))
+            case Whilethen(condition, then_body):
+                return Whilethen(r(condition), r(then_body))
+            case FunCall(fn, args):
+                return FunCall(r(fn), [r(arg) for arg in args])
+        return program
+
+def resolve(program: AST):
+    resolver = Resolver()
+    program = resolver.resolve(program)
+    return program, resolver.layouts[0].size
+
+"""
+    compile_to_closures walks the AST once and returns a Python
+    function that runs it. Operators and child nodes are resolved
+    while compiling and variables are read from list frames by slot
+    (see resolve), so running the result never goes through the
+    match in eval.
+
+        compiled = compile_to_closures(program)
+        compiled()
+"""
+
+def compile_to_closures(program: AST):
+    if not scoping_agrees(program):
+        return lambda frame=None: eval(program)
+    program, frame_size = resolve(program)
+    body = build_closure(program)
+    def run(frame=None):
+        if frame is None:
+            frame = [None] * frame_size
+        return body(frame)
+    return run
+
+"""
+    eval compiles a function to closures when that cannot change what
+    it computes: lexical and dynamic scoping only differ for the names
+    a body does not bind itself. closed_function accepts a body whose
+    names are all its parameters and its own lets, and whose calls are
+    all to the function itself (which is then the function the caller
+    just found under that name). Bodies that define functions or
+    constants are left to eval.
+"""
+
+def closed_function(name, params, body) -> bool:
+    bound = frozenset(params)
+    if name in bound or len(bound) != len(params):
+        return False
+    def closed(program, bound):
+        match program:
+            case Variable():
+                return program in bound
+            case LetFun() | LetConst():
+                return False
+            case Let(Variable() as v, e1, e2):
+                return v != name and closed(e1, bound) and closed(e2, bound | {v})
+            case Put(Variable() as v, e):
+                return v in bound and closed(e, bound)
+            case FunCall(fn, args):
+                return fn == name and all(closed(arg, bound) for arg in args)
+            case list():
+                return all(closed(thing, bound) for thing in program)
+            case Node():
+                return all(closed(getattr(program, f), bound) for f in program.__dataclass_fields__)
+        return True
+    return closed(body, bound)
+
+"""
+    The compiled backends scope names lexically while eval scopes them
+    dynamically, and the two only agree on every call when the
+    function called is closed. compile_to_closures and compile_program
+    leave a program with any other function to eval as a whole.
+"""
+
+def scoping_agrees(program) -> bool:
+    match program:
+        case LetFun(name, params, body, expr):
+            return closed_function(name, params, body) and scoping_agrees(expr)
+        case list():
+            return all(scoping_agrees(thing) for thing in program)
+        case Node():
+            return all(scoping_agrees(getattr(program, f)) for f in program.__dataclass_fields__)
+    return True
+
+"""
+    A compiled function whose body is also pure (no print, no list
+    mutation; closed_function already rules out assigning to anything
+    but its own locals) always returns the same value for the same
+    arguments, so the closure compiler puts a Memo in front of its
+    body and the VM gives its closures one; eval gets it through
+    make_function. Recursive calls load the same function and go
+    through the Memo too, which makes fib-like recursion linear. The
+    table keeps the memo_size most recently used results; memo_size
+    = 0 turns memoization off.
+"""
+
+memo_size = 4096
+mutating_list_operators = ["append", "assign", "remove", "pop"]
+
+def pure_body(program) -> bool:
+    match program:
+        case PrintOp():
+            return False
+        case ListOp(op) if op in mutating_list_operators:
+            return False
+        case list():
+            return all(pure_body(thing) for thing in program)
+        case Node():
+            return all(pure_body(getattr(program, f)) for f in program.__dataclass_fields__)
+    return True
+
+@dataclass
+class Memo:
+    arity: int
+    body: object
+    max_size: int
+    table: dict = field(default_factory=dict, repr=False)
+    hits: int = 0
+    misses: int = 0
+
+    # Called with the call frame like the body it stands for. The
+    # argument types are part of the key so True and 1 stay apart.
+    def __call__(self, frame):
+        args = frame[1:1 + self.arity]
+        key = (*args, *map(type, args))
+        table = self.table
+        try:
+            value = table.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = self.body(frame)
+            if len(table) >= self.max_size:
+                del table[next(iter(table))]
+        except TypeError:
+            # a list argument
+            return self.body(frame)
+        else:
+            self.hits += 1
+        table[key] = value
+        return value
+
+def make_function(name, params, body) -> FnObject:
+    if not closed_function(name, params, body):
+        return FnObject(params, body)
+    return compile_to_closures(LetFun(name, params, body, name))()
+
+def load_closure(v):
+    depth, slot = v.depth, v.slot
+    if depth is None:
+        def unbound(frame):
+            raise KeyError()
+        return unbound
+    if depth == 0:
+        def local(frame):
+            return frame[slot]
+        return local
+    if depth == 1:
+        def outer(frame):
+            return frame[0][slot]
+        return outer
+    def deref(frame):
+        for _ in range(depth):
+            frame = frame[0]
+        return frame[slot]
+    return deref
+
+def store_closure(v):
+    depth, slot = v.depth, v.slot
+    if depth is None:
+        def unbound(frame, value):
+            raise KeyError()
+        return unbound
+    if depth == 0:
+        def local(frame, value):
+            frame[slot] = value
+        return local
+    def deref(frame, value):
+        for _ in range(depth):
+            frame = frame[0]
+        frame[slot] = value
+    return deref
+
+def build_closure(program: AST):
+    compile = build_closure
+
+    def fail(error):
+        def raise_error(frame):
+            raise error.with_traceback(None)
+        return raise_error
+
+    # Number literal operands (i<10, i+=1, a%3) are passed straight
+    # to the operator instead of through a closure call.
+    def binary(fn, left, right):
+        cleft = compile(left)
+        if isinstance(right, NumLiteral):
+            value = right.value
+            def binop_literal(frame):
+                return fn(cleft(frame), value)
+            return binop_literal
+        cright = compile(right)
+        def binop(frame):
+            return fn(cleft(frame), cright(frame))
+        return binop
+
+    def checked(check, *operands):
+        error = static_check(check, *operands)
+        return None if error is None else fail(error)
+
+    match program:
+        case NumLiteral(value) | StringLiteral(value) | IntLiteral(value) \
+                | FracLiteral(value) | ListLiteral(value) | BoolLiteral(value):
+            def literal(frame):
+                return value
+            return literal
+        case Variable(_) as v:
+            return load_closure(v)
+
+        case Let(Variable(_) as v, e1, e2) | LetConst(Variable(_) as v, e1, e2):
+            c1 = compile(e1)
+            c2 = compile(e2)
+            slot = v.slot
+            def let(frame):
+                frame[slot] = c1(frame)
+                return c2(frame)
+            return let
+
+        case Put(Variable(_) as v, e):
+            c = compile(e)
+            store = store_closure(v)
+            def put(frame):
+                value = c(frame)
+                store(frame, value)
+                return value
+            return put
+        case Get(Variable(_) as v):
+            return load_closure(v)
+        case Seq(things):
+            cthings = [compile(thing) for thing in things]
+            def seq(frame):
+                v = None
+                for thing in cthings:
+                    v = thing(frame)
+                return v
+            return seq
+
+        case BinOp(op, left, right) if op in Bitwise_operators:
+            return checked(check_bitwise, left, right) or binary(binary_functions[op], left, right)
+        case BinOp("+=", Variable(_) as v, right):
+            error = checked(check_add_assign, v, right)
+            if error:
+                return error
+            load = load_closure(v)
+            store = store_closure(v)
+            if isinstance(right, NumLiteral):
+                step = right.value
+                def add_assign_literal(frame):
+                    new_val = add(load(frame), step)
+                    store(frame, new_val)
+                    return new_val
+                return add_assign_literal
+            cright = compile(right)
+            def add_assign(frame):
+                new_val = add(load(frame), cright(frame))
+                store(frame, new_val)
+                return new_val
+            return add_assign
+        case BinOp("+=", left, right):
+            return checked(check_add_assign, left, right) or fail(InvalidProgram())
+        case BinOp(op, left, right) if op in binary_functions:
+            return binary(binary_functions[op], left, right)
+
+        case PrintOp(inp):
+            c = compile(inp)
+            write = output.write
+            def print_op(frame):
+                write(c(frame))
+            return print_op
+
+        case StringOp('add', left, right):
+            return checked(check_concat, left, right) or binary(concat, left, right)
+        case StringOp('compare', left, right):
+            return checked(check_compare, left, right) or binary(operator.eq, left, right)
+        case StringOp('length', left):
+            error = checked(check_length, left)
+            if error:
+                return error
+            c = compile(left)
+            def length(frame):
+                return len(c(frame))
+            return length
+        case StringSlice("slice", left, start, stop, step):
+            cleft, cstart, cstop, cstep = map(compile, (left, start, stop, step))
+            def string_slice(frame):
+                left_value = cleft(frame)
+                return slice_text(left_value, cstart(frame), cstop(frame), cstep(frame))
+            return string_slice
+
+        case UnOp(op, vari) if op in Unary_operators:
+            fn = unary_functions[op]
+            c = compile(vari)
+            if not isinstance(vari, Variable):
+                def invalid_unop(frame):
+                    fn(c(frame))
+                    raise InvalidProgram()
+                return invalid_unop
+            store = store_closure(vari)
+            def unop(frame):
+                un = fn(c(frame))
+                store(frame, un)
+                return un
+            return unop
+
+        case LogOp("and", left, right):
+            cleft = compile(left)
+            cright = compile(right)
+            def log_and(frame):
+                return cleft(frame) and cright(frame)
+            return log_and
+        case LogOp("or", left, right):
+            cleft = compile(left)
+            cright = compile(right)
+            def log_or(frame):
+                return cleft(frame) or cright(frame)
+            return log_or
+        case LogOp("not", right):
+            c = compile(right)
+            def log_not(frame):
+                return not c(frame)
+            return log_not
+
+        case If(c, b):
+            cc = compile(c)
+            cb = compile(b)
+            def if_(frame):
+                if cc(frame) == True:
+                    return cb(frame)
+            return if_
+        case IfElse(c, l, r):
+            cc = compile(c)
+            cl = compile(l)
+            cr = compile(r)
+            def if_else(frame):
+                if cc(frame) == True:
+                    return cl(frame)
+                return cr(frame)
+            return if_else
+
+        case ListOp("append", left, right):
+            cleft = compile(left)
+            cright = compile(right)
+            def append(frame):
+                l = cleft(frame)
+                return list_append(l, cright(frame))
+            return append
+        case ListOp('length', left):
+            c = compile(left)
+            def list_length(frame):
+                return len(c(frame))
+            return list_length
+        case ListOp('assign', array, index, assign):
+            carray = compile(array)
+            cindex = compile(index)
+            cassign = compile(assign)
+            def assign_item(frame):
+                arr = carray(frame)
+                value = cassign(frame)
+                return list_assign(arr, cindex(frame), value)
+            return assign_item
+        case ListOp('remove', array):
+            carray = compile(array)
+            def remove(frame):
+                arr = carray(frame)
+                arr.pop()
+                return arr
+            return remove
+        case ListOp('get', array, index):
+            carray = compile(array)
+            cindex = compile(index)
+            # list_index, inlined; an IntList is read through its items
+            def list_get(frame):
+                arr = carray(frame)
+                i = int(cindex(frame))
+                if not 0 <= i < len(arr):
+                    raise InvalidProgram()
+                if type(arr) is IntList:
+                    return arr.items[i]
+                return arr[i]
+            return list_get
+
+        case Un_boolify(left):
+            c = compile(left)
+            def un_boolify(frame):
+                return unboolify(c(frame))
+            return un_boolify
+
+        case For(condition, update, body):
+            ccondition = compile(condition)
+            cupdate = compile(update)
+            cbody = compile(body)
+            def for_loop(frame):
+                while ccondition(frame):
+                    cbody(frame)
+                    cupdate(frame)
+            return for_loop
+        case Whilethen(condition, then_body):
+            ccondition = compile(condition)
+            cbody = compile(then_body)
+            def while_loop(frame):
+                while ccondition(frame) == True:
+                    cbody(frame)
+            return while_loop
+
+        case LetFun(Variable(_) as v, params, body, expr, frame_size):
+            cbody = compile(body)
+            if memo_size and pure_body(body):
+                cbody = Memo(len(params), cbody, memo_size)
+            cexpr = compile(expr)
+            slot = v.slot
+            def letfun(frame):
+                frame[slot] = FnObject(params, cbody, frame, frame_size)
+                return cexpr(frame)
+            return letfun
+        case FunCall(Variable(_) as v, args):
+            load = load_closure(v)
+            cargs = [compile(arg) for arg in args]
+            def funcall(frame):
+                fn = load(frame)
+                argv = [arg(frame) for arg in cargs]
+                if len(argv) != len(fn.params):
+                    raise InvalidProgram()
+                call_frame = [None] * fn.frame_size
+                call_frame[0] = fn.frame
+                call_frame[1:1 + len(argv)] = argv
+                return fn.body(call_frame)
+            return funcall
+
+    return fail(InvalidProgram())
@@ -1,5 +1,10 @@
 from start import *
+from vm import run
+from optimizer import optimize, count_nodes
+from profiler import Profiler
+from iterative import eval_iterative
 import pytest
+import start
 
 def test_modulus_operator():
     a  = Variable("a")
@@ -527,8 +532,364 @@ def test_while():
     l = Let(v,n1, w)
     eval(l)  
     # output =  1 2 3 4 5 6 7 8 9
-<<<<<<< HEAD
 
-    
-=======
->>>>>>> 45827477c3a406aafee4dba10ba5cb79821a284e
+def test_vm_arithmetic():
+    a  = Variable("a")
+    b  = Variable("b")
+    e  = Let(a, NumLiteral(5), Let(b, NumLiteral(11), BinOp("%", b, a)))
+    assert run(e) == eval(e) == 1
+    e  = Let(a, NumLiteral(5), BinOp("+", a, Let(a, BinOp("+", a, a), BinOp("+", a, a))))
+    assert run(e) == eval(e) == 25
+    e  = BinOp("<<", NumLiteral(8), NumLiteral(3))
+    assert run(e) == 64
+
+def test_vm_unop():
+    v=Variable('v')
+    e2=UnOp('--',v)
+    c=Let(v,NumLiteral(5),BinOp('*',v,Let(v,e2,e2)))
+    assert run(c)==15
+
+def test_vm_loops():
+    i=Variable('i')
+    s=Variable('s')
+    body=Put(s,BinOp("+",s,BinOp("*",i,i)))
+    f=Let(i,NumLiteral(0),Let(s,NumLiteral(0),Seq([For(BinOp("<",i,NumLiteral(10)),BinOp("+=",i,NumLiteral(1)),body),s])))
+    assert run(f)==eval(f)==285
+
+    v=Variable('v')
+    w=Let(v,NumLiteral(0),Seq([Whilethen(BinOp("<",v,NumLiteral(9)),UnOp("++",v)),v]))
+    assert run(w)==9
+
+def test_vm_functions():
+    f=Variable('f')
+    n=Variable('n')
+    body=IfElse(BinOp(">",n,NumLiteral(1)),BinOp("*",n,FunCall(f,[BinOp("-",n,NumLiteral(1))])),NumLiteral(1))
+    e=LetFun(f,[n],body,FunCall(f,[NumLiteral(5)]))
+    assert run(e)==eval(e)==120
+
+def test_vm_lists_and_strings():
+    l=ListLiteral([23,45,12])
+    assert run(ListOp('assign',l,NumLiteral(0),NumLiteral(90)))==[90,45,12]
+    assert run(ListOp('get',l,NumLiteral(1)))==45
+    with pytest.raises(InvalidProgram):
+        run(ListOp('get',l,NumLiteral(3)))
+
+    s=StringOp("add",StringLiteral("This "),StringLiteral("world"))
+    assert run(s)=="This world"
+    assert run(StringOp('length',s))==10
+
+def test_vm_invalid_program():
+    a=Variable("a")
+    # bitwise operators reject variable operands, but only when reached
+    e=Let(a,NumLiteral(1),BinOp("&",a,NumLiteral(1)))
+    with pytest.raises(InvalidProgram):
+        run(e)
+    e=Let(a,NumLiteral(1),IfElse(BoolLiteral(False),BinOp("&",a,NumLiteral(1)),a))
+    assert run(e)==1
+
+def test_closures():
+    i=Variable('i')
+    s=Variable('s')
+    body=Put(s,BinOp("+",s,BinOp("*",i,i)))
+    f=Let(i,NumLiteral(0),Let(s,NumLiteral(0),Seq([For(BinOp("<",i,NumLiteral(10)),BinOp("+=",i,NumLiteral(1)),body),s])))
+    assert compile_to_closures(f)()==285
+
+    f=Variable('f')
+    n=Variable('n')
+    body=IfElse(BinOp(">",n,NumLiteral(1)),BinOp("*",n,FunCall(f,[BinOp("-",n,NumLiteral(1))])),NumLiteral(1))
+    e=LetFun(f,[n],body,FunCall(f,[NumLiteral(5)]))
+    assert compile_to_closures(e)()==120
+
+    v=Variable('v')
+    e2=UnOp('--',v)
+    c=Let(v,NumLiteral(5),BinOp('*',v,Let(v,e2,e2)))
+    assert compile_to_closures(c)()==15
+
+    a=Variable("a")
+    e=Let(a,NumLiteral(1),BinOp("&",a,NumLiteral(1)))
+    compiled=compile_to_closures(e)
+    with pytest.raises(InvalidProgram):
+        compiled()
+
+def test_resolve_slots():
+    a=Variable("a")
+    b=Variable("b")
+    e=Let(a,NumLiteral(1),Let(b,NumLiteral(2),BinOp("+",a,b)))
+    resolved,size=resolve(e)
+    assert size==3
+    assert resolved.e2.e2.left.depth==0 and resolved.e2.e2.left.slot==1
+    assert resolved.e2.e2.right.slot==2
+    # depth and slot do not take part in equality
+    assert resolved.e2.e2.left==a
+    assert eval(resolved)==3
+
+    # free variables of a function body are one frame up
+    f=Variable("f")
+    n=Variable("n")
+    e=Let(a,NumLiteral(10),LetFun(f,[n],BinOp("+",a,n),FunCall(f,[NumLiteral(5)])))
+    resolved,size=resolve(e)
+    body=resolved.e2.body
+    assert (body.left.depth,body.left.slot)==(1,1)
+    assert (body.right.depth,body.right.slot)==(0,1)
+    assert run(e)==compile_to_closures(e)()==15
+
+def test_numeric_tower():
+    assert eval(BinOp("/",NumLiteral(8),NumLiteral(2)))==4
+    assert type(eval(BinOp("/",NumLiteral(8),NumLiteral(2))))==int
+    assert eval(BinOp("/",NumLiteral(7),NumLiteral(2)))==Fraction(7,2)
+    assert eval(BinOp("**",NumLiteral(2),NumLiteral(-1)))==Fraction(1,2)
+    half=BinOp("/",NumLiteral(1),NumLiteral(2))
+    # integral results drop back to int
+    e=BinOp("/",half,BinOp("/",NumLiteral(1),NumLiteral(4)))
+    assert eval(e)==2 and type(run(e))==int
+    assert type(compile_to_closures(e)())==int
+    assert NumLiteral(Fraction(6,3)).value==2 and type(NumLiteral(Fraction(6,3)).value)==int
+    with pytest.raises(ZeroDivisionError):
+        run(BinOp("/",NumLiteral(1),NumLiteral(0)))
+
+def test_binop_opcodes():
+    e = BinOp("**", NumLiteral(2), NumLiteral(10))
+    assert binary_operators[e.opcode] == "**"
+    assert e == BinOp("**", NumLiteral(2), NumLiteral(10))
+    assert not hasattr(e, "__dict__")
+    assert eval(e) == 1024
+    assert eval(BinOp("<=", e, NumLiteral(1024))) == True
+
+def test_check_once():
+    calls = []
+    def check(left, right):
+        calls.append(left)
+        raise InvalidProgram()
+    env = Environment()
+    node = BinOp("&", NumLiteral(1), NumLiteral(2))
+    for _ in range(3):
+        with pytest.raises(InvalidProgram):
+            env.check_once(check, node, node.left, node.right)
+    assert len(calls) == 1
+
+    i = Variable("i")
+    e = Let(i, NumLiteral(0), Seq([
+        Whilethen(BinOp("<", i, NumLiteral(5)), Put(i, BinOp("+", i, BinOp("&", NumLiteral(3), NumLiteral(1))))),
+        i]))
+    assert eval(e) == 5
+
+def test_optimizer():
+    a = Variable("a")
+    e = Let(a, BinOp("*", NumLiteral(60), NumLiteral(60)),
+            IfElse(BinOp("<", NumLiteral(1), NumLiteral(2)), BinOp("+", BinOp("*", a, NumLiteral(1)), NumLiteral(0)), a))
+    o = optimize(e)
+    assert o == Let(a, NumLiteral(3600), a)
+    assert count_nodes(e) - count_nodes(o) == 11
+    assert eval(o) == eval(e) == 3600
+
+    # a string is not known to be a number, so a+0 still fails
+    s = Variable("s")
+    e = Let(s, StringLiteral('"x"'), BinOp("+", s, NumLiteral(0)))
+    assert optimize(e) == e
+    # division by zero is left for run time
+    e = BinOp("/", NumLiteral(1), NumLiteral(0))
+    assert optimize(e) == e
+    # the operands of checked operators are left alone
+    e = BinOp("&", BinOp("&", NumLiteral(1), NumLiteral(3)), NumLiteral(1))
+    assert optimize(e) == e
+    assert optimize(LogOp("and", BoolLiteral(True), a)) == a
+
+def test_loops_run_in_enclosing_scope():
+    i, s, t = Variable("i"), Variable("s"), Variable("t")
+    body = Let(t, BinOp("*", i, i), Put(s, BinOp("+", s, t)))
+    loop = For(BinOp("<", i, NumLiteral(4)), BinOp("+=", i, NumLiteral(1)), body)
+    env = Environment()
+    assert eval(Let(i, NumLiteral(0), Let(s, NumLiteral(0), Seq([loop, s]))), env) == 14
+    assert env.envs == [{}]
+    loop = Whilethen(BinOp(">", s, i), Put(s, BinOp("-", s, NumLiteral(1))))
+    assert eval(Let(i, NumLiteral(3), Let(s, NumLiteral(9), Seq([loop, s])))) == 3
+
+def test_profiler():
+    i = Variable("i")
+    loop = For(BinOp("<", i, NumLiteral(10)), BinOp("+=", i, NumLiteral(1)), Put(i, BinOp("+", i, NumLiteral(0))))
+    profiler = Profiler()
+    original = start.eval
+    assert profiler.run(Let(i, NumLiteral(0), Seq([loop, i]))) == 10
+    assert start.eval is original
+    assert profiler.by_class["For"].calls == 1
+    assert profiler.by_operator["BinOp +="].calls == 10
+    assert profiler.by_operator["BinOp +"].calls == 10
+    stats = profiler.by_class["Let"]
+    assert stats.inclusive >= stats.exclusive >= 0
+    # functions are not compiled or memoized while profiling
+    f, n = Variable("f"), Variable("n")
+    body = IfElse(BinOp("<", n, NumLiteral(2)), n,
+                  BinOp("+", FunCall(f, [BinOp("-", n, NumLiteral(1))]), FunCall(f, [BinOp("-", n, NumLiteral(2))])))
+    profiler = Profiler()
+    original = start.make_function
+    assert profiler.run(LetFun(f, [n], body, FunCall(f, [NumLiteral(10)]))) == 55
+    assert start.make_function is original
+    assert profiler.by_class["FunCall"].calls == 177
+    assert profiler.by_operator["BinOp +"].calls == 88
+
+def test_iterative_eval():
+    n, acc, f = Variable("n"), Variable("acc"), Variable("f")
+    # f(n) = if n > 0 then 1 + f(n - 1) else 0, far deeper than the
+    # Python recursion limit
+    body = IfElse(BinOp(">", n, NumLiteral(0)),
+                  BinOp("+", NumLiteral(1), FunCall(f, [BinOp("-", n, NumLiteral(1))])),
+                  NumLiteral(0))
+    assert eval_iterative(LetFun(f, [n], body, FunCall(f, [NumLiteral(2000)]))) == 2000
+    # the tail calls of g(n, acc) run in one scope
+    body = IfElse(BinOp(">", n, NumLiteral(0)),
+                  Let(Variable("m"), BinOp("-", n, NumLiteral(1)), FunCall(f, [Variable("m"), BinOp("+", acc, n)])),
+                  acc)
+    env = Environment()
+    program = LetFun(f, [n, acc], body, FunCall(f, [NumLiteral(10000), NumLiteral(0)]))
+    assert eval_iterative(program, env) == 50005000
+    assert env.envs == [{}]
+    program = LetFun(f, [n, acc], body, FunCall(f, [NumLiteral(100), NumLiteral(0)]))
+    assert eval_iterative(program) == eval(program)
+
+def test_compiled_functions():
+    f, g, n, x = Variable("f"), Variable("g"), Variable("n"), Variable("x")
+    body = IfElse(BinOp(">", n, NumLiteral(1)), BinOp("*", n, FunCall(f, [BinOp("-", n, NumLiteral(1))])), NumLiteral(1))
+    assert closed_function(f, [n], body)
+    assert make_function(f, [n], body).frame is not None
+    assert eval(LetFun(f, [n], body, FunCall(f, [NumLiteral(5)]))) == 120
+    # x is free and g is not f: both are looked up in the caller's scopes
+    assert not closed_function(f, [n], BinOp("+", n, x))
+    assert not closed_function(f, [n], FunCall(g, [n]))
+    e = Let(x, NumLiteral(2), LetFun(f, [n], BinOp("+", n, x), Let(x, NumLiteral(10), FunCall(f, [NumLiteral(1)]))))
+    assert eval(e) == 11
+    with pytest.raises(InvalidProgram):
+        eval(LetFun(f, [n], body, FunCall(f, [NumLiteral(1), NumLiteral(2)])))
+
+def test_memoized_functions():
+    f, n, l = Variable("f"), Variable("n"), Variable("l")
+    body = IfElse(BinOp("<", n, NumLiteral(2)), n,
+                  BinOp("+", FunCall(f, [BinOp("-", n, NumLiteral(1))]), FunCall(f, [BinOp("-", n, NumLiteral(2))])))
+    env = Environment()
+    program = LetFun(f, [n], body, FunCall(f, [NumLiteral(60)]))
+    assert eval(program, env) == 1548008755920
+    memo = env.functions[id(program)][1].body
+    assert (memo.misses, memo.hits) == (61, 58)
+    assert run(program) == 1548008755920
+    assert compile_to_closures(program)() == 1548008755920
+    assert not pure_body(Seq([PrintOp(n), n]))
+    assert not pure_body(ListOp("append", l, n))
+    assert pure_body(ListOp("get", l, n))
+    memo = Memo(1, lambda frame: frame[1] * 2, 2)
+    assert [memo([None, x]) for x in [1, 2, 1, 3, 2, True]] == [2, 4, 2, 6, 4, 2]
+    assert (memo.misses, memo.hits, len(memo.table)) == (5, 1, 2)
+
+def test_int_lists():
+    assert type(ListLiteral([1, 2, 3]).list_val) is IntList
+    assert type(ListLiteral([1, "a"]).list_val) is list
+    assert type(ListLiteral([2**64]).list_val) is list
+    assert IntList([1, 2]) == [1, 2] and str(IntList([1, 2])) == "[1, 2]"
+    # a value the array cannot hold moves the elements to a list in place
+    # (a list literal is mutated in place, so each run gets a new one)
+    engines = [eval, run, eval_iterative, lambda p: compile_to_closures(p)()]
+    l = Variable("l")
+    for engine in engines:
+        program = Let(l, ListLiteral([1, 2]), Seq([ListOp("append", l, StringLiteral("x")),
+                                                   ListOp("assign", l, NumLiteral(0), NumLiteral(2**70)), l]))
+        assert engine(program) == [2**70, 2, "x"]
+        assert type(program.e1.list_val) is IntList and type(program.e1.list_val.items) is list
+    # so the stores reach every alias of the list
+    a, b = Variable("a"), Variable("b")
+    for engine in engines:
+        program = Let(a, ListLiteral([1, 2]), Let(b, a, Seq([ListOp("append", b, StringLiteral("x")), ListOp("length", a)])))
+        assert engine(program) == 3
+
+def test_list_get_evaluates_once():
+    l, i = Variable("l"), Variable("i")
+    # the index expression increments i: it runs once per read
+    program = Let(l, ListLiteral([10, 20, 30]), Let(i, NumLiteral(0), Seq([ListOp("get", l, UnOp("++", i)), i])))
+    assert eval(program) == eval_iterative(program) == run(program) == 1
+    for index in [3, -1]:
+        for engine in [eval, eval_iterative, run, lambda p: compile_to_closures(p)()]:
+            with pytest.raises(InvalidProgram):
+                engine(ListOp("get", ListLiteral([1, 2, 3]), NumLiteral(index)))
+            with pytest.raises(InvalidProgram):
+                engine(ListOp("assign", ListLiteral([1, 2, 3]), NumLiteral(index), NumLiteral(0)))
+
+def test_ropes():
+    s, piece = "", "x" * 100
+    for _ in range(5):
+        s = concat(s, piece)
+    assert type(s) is Rope and len(s) == 500
+    assert s == "x" * 500 and "x" * 500 == s and s != "y"
+    assert hash(s) == hash("x" * 500) and s[1:3] == "xx" and str(s) == "x" * 500
+    # extending an older rope does not disturb the newer one
+    t = concat(s, "a")
+    u = concat(s, "b")
+    assert str(t)[-2:] == "xa" and str(u)[-2:] == "xb" and len(t) == len(u) == 501
+    assert concat(u, 7) == "x" * 500 + "b7"
+    v = Variable("v")
+    program = Let(v, StringLiteral("y" * 300), ListOp("length", StringOp("add", v, v)))
+    assert eval(program) == run(program) == 600
+
+def test_string_views():
+    source = "".join(chr(97 + i % 26) for i in range(1000))
+    view = slice_text(source, 10, 900, 1)
+    assert type(view) is StringView and view.source is source
+    assert view == source[10:900] and len(view) == 890
+    inner = view[5:500:2]
+    assert type(inner) is StringView and inner == source[10:900][5:500:2]
+    assert view[::-1] == source[10:900][::-1] and view[3] == source[13]
+    assert type(slice_text(source, 0, 10, 1)) is str
+    assert slice_text(concat("a" * 300, "b"), 290, 301, 1) == "a" * 10 + "b"
+    v = Variable("v")
+    program = Let(v, StringLiteral("z" * 200), StringSlice("slice", v, IntLiteral(1), IntLiteral(101), IntLiteral(1)))
+    assert eval(program) == run(program) == compile_to_closures(program)() == "z" * 100
+
+def test_eval_updates_in_place():
+    a = Variable("a")
+    program = Let(a, NumLiteral(5), Seq([BinOp("+=", a, NumLiteral(2)), UnOp("++", a), UnOp("-", a)]))
+    assert eval(program) == run(program) == -8
+    # the operand still runs before the update is refused
+    environment = Environment()
+    environment.add(a, 1)
+    with pytest.raises(InvalidProgram):
+        eval(UnOp("++", Put(a, NumLiteral(5))), environment)
+    assert environment.get(a) == 5
+    program = Let(a, BinOp("/", NumLiteral(1), NumLiteral(2)), Seq([BinOp("+=", a, BinOp("/", NumLiteral(1), NumLiteral(2))), a]))
+    assert eval(program) == 1 and type(eval(program)) is int
+
+def test_optimizer_keeps_invalid_bitwise_operands():
+    program = PrintOp(BinOp("&", BoolLiteral(True), NumLiteral(1)))
+    for engine in [eval, run]:
+        with pytest.raises(InvalidProgram):
+            engine(program)
+        with pytest.raises(InvalidProgram):
+            engine(optimize(program))
+    assert optimize(BinOp("&", NumLiteral(6), NumLiteral(3))) == NumLiteral(2)
+
+def test_engines_agree_on_free_names():
+    x, f = Variable("x"), Variable("f")
+    program = Let(x, NumLiteral(1), LetFun(f, [], x, Let(x, NumLiteral(2), FunCall(f, []))))
+    assert eval(program) == eval_iterative(program) == run(program) == compile_to_closures(program)() == 2
+
+def test_integral_fractions_become_ints():
+    half = BinOp("/", NumLiteral(1), NumLiteral(2))
+    for op in ["+", "-", "*"]:
+        other = half if op != "*" else NumLiteral(4)
+        program = BinOp(op, half, other)
+        for engine in [eval, run, eval_iterative, lambda p: compile_to_closures(p)()]:
+            assert type(engine(program)) is int
+    a = Variable("a")
+    for right in [half, NumLiteral(Fraction(1, 2))]:
+        program = Let(a, half, Seq([BinOp("+=", a, right), a]))
+        for engine in [eval, run, eval_iterative, lambda p: compile_to_closures(p)()]:
+            assert type(engine(program)) is int
+    assert eval(BinOp("+", half, NumLiteral(1))) == Fraction(3, 2)
+
+def test_engines_reject_wrong_argument_counts():
+    f, a, b = Variable("f"), Variable("a"), Variable("b")
+    engines = [eval, eval_iterative, run, lambda p: compile_to_closures(p)()]
+    for args in [[NumLiteral(5)], [NumLiteral(5), NumLiteral(6), NumLiteral(7)]]:
+        program = LetFun(f, [a, b], BinOp("+", a, NumLiteral(1)), FunCall(f, args))
+        for engine in engines:
+            with pytest.raises(InvalidProgram):
+                engine(program)
+    # in tail position too
+    program = LetFun(f, [a], If(a, FunCall(f, [])), FunCall(f, [BoolLiteral(True)]))
+    with pytest.raises(InvalidProgram):
+        eval_iterative(program)
@@ -0,0 +1,153 @@
+from parse import *
+import io
+import os
+import pytest
+
+def lex(source):
+    return list(tokenize(source))
+
+def test_tokens():
+    assert lex("let a = 12;") == [Keyword("let"), Identifier("a"), Operator("="), Num(12), EndStatement(";")]
+    assert lex("a+=2 b**3") == [Identifier("a"), Operator("+="), Num(2), Identifier("b"), Operator("**"), Num(3)]
+    assert lex("x & y") == [Identifier("x"), BitwiseOperator("&"), Identifier("y")]
+
+def test_string_keeps_quotes():
+    [token] = lex('"hi there"')
+    assert token == String('"hi there"')
+
+def test_unknown_character_is_none():
+    assert lex("a\r\nb") == [Identifier("a"), None, Identifier("b")]
+
+def test_operator_at_end_of_file():
+    assert lex("a +") == [Identifier("a")]
+
+def test_lexer_matches_tokenize():
+    source = open("myfile.txt").read()
+    lexer = Lexer.from_stream(Stream.from_string(source))
+    assert list(lexer) == lex(source)
+
+def test_token_array_matches_tokenize():
+    source = open("myfile.txt").read() + " a + 1 +"
+    assert TokenArray.from_source(source).tokens == lex(source)
+
+def parse(source):
+    return Parser.from_source(source).parse_expr()
+
+def test_seq_closing_brace_at_end_of_file():
+    assert parse("{ print 1; }") == Seq([PrintOp(NumLiteral(1))])
+    assert parse("{ print 1; };") == Seq([PrintOp(NumLiteral(1))])
+
+def test_seq_identifier_statement():
+    assert parse("{ x = 1; f(x); }") == Seq([Put(Variable("x"), NumLiteral(1)), FunCall(Variable("f"), [Variable("x")])])
+
+def test_consecutive_prints():
+    source = "{ print a.length; print a; }"
+    expected = Seq([PrintOp(ListOp("length", Variable("a"))), PrintOp(Variable("a"))])
+    assert parse(source) == expected
+    lexer = Lexer.from_stream(Stream.from_string(source))
+    assert Parser.from_lexer(lexer).parse_expr() == expected
+
+def test_lexer_and_token_array_parse_alike():
+    source = open("ANS/answer_18.txt").read()
+    lexer = Lexer.from_stream(Stream.from_string(source))
+    assert Parser.from_lexer(lexer).parse_expr() == parse(source)
+
+def test_line_column():
+    stream = Stream("ab\ncd\n\nef", 0)
+    assert stream.line_column(0) == (1, 1)
+    assert stream.line_column(4) == (2, 2)
+    assert stream.line_column(7) == (4, 1)
+
+def test_spans():
+    source = "{\n  x = 1;\n  print x + 2;\n}"
+    tokens = TokenArray.from_source(source)
+    program = Parser(tokens).parse_expr()
+    put, printed = program.things
+    assert source[slice(*put.span)].startswith("x = 1")
+    assert tokens.stream.line_column(printed.span[0]) == (3, 3)
+    assert source[slice(*printed.inp.span)].strip() == "x + 2"
+    assert optimize(program).things[1].span == printed.span
+
+def test_token_error_has_location():
+    with pytest.raises(TokenError, match="line 2, column 7"):
+        parse("let a = 1 in\nlet = 2 in a;")
+
+def test_program_cache(tmp_path):
+    filename = tmp_path / "prog.txt"
+    source = "let a = 6 in a * 7;"
+    first = load_program(filename, source, "eval")
+    cache = ProgramCache.for_file(filename)
+    assert cache.get(cache.key(source, "ast")) == first
+    assert eval(load_program(filename, source, "eval")) == 42
+    assert VM().execute(load_program(filename, source, "vm")) == 42
+
+    path = cache.path(cache.key(source, "ast"))
+    with open(path, "wb") as f:
+        f.write(b"garbage")
+    assert cache.get(cache.key(source, "ast")) is None
+
+def test_program_cache_drops_corrupt_entries(tmp_path):
+    filename = tmp_path / "prog.txt"
+    source = "let a = 6 in a * 7;"
+    cache = ProgramCache.for_file(filename)
+    path = cache.path(cache.key(source, "ast"))
+    load_program(filename, source, "eval")
+    good = open(path, "rb").read()
+    corrupt = [b"\x80\x09", good[:len(good) // 2], good[:2] + bytes(reversed(good[2:]))]
+    corrupt += [bytes(b ^ 0x5a if i % 7 == 3 else b for i, b in enumerate(good))]
+    for data in corrupt:
+        with open(path, "wb") as f:
+            f.write(data)
+        assert eval(load_program(filename, source, "eval")) == 42
+        assert cache.get(cache.key(source, "ast")) is not None
+
+def test_program_cache_evicts_least_recently_used(tmp_path):
+    cache = ProgramCache(str(tmp_path), max_size=2000)
+    for i in range(10):
+        cache.put(f"k{i}", list(range(100)))
+        os.utime(cache.path(f"k{i}"), (i, i))
+    assert cache.get("k0") is None
+    assert cache.get("k9") == list(range(100))
+
+def test_output_to_file(tmp_path, monkeypatch):
+    filename = tmp_path / "prog.txt"
+    filename.write_text("let i=0 in for i<5000 up i+=1 do { print i; };")
+    expected = "".join(f"{i}\n" for i in range(5000))
+    for engine in ["vm", "closure", "eval", "iterative"]:
+        out = tmp_path / f"{engine}.txt"
+        monkeypatch.setattr(sys, "argv", ["parse.py", "--no-cache", "--engine", engine,
+                                          "--filename", str(filename), "--output", str(out)])
+        main()
+        assert out.read_text() == expected
+    assert output.fd is None and not output.lines
+
+def test_stream_statements():
+    source = '{\n  print 1+2;\n  let s=String "abc" in print s;\n  let a=list [4,5] in { a.append 6; print a; };\n  x=3;\n}\n'
+    whole = parse(source).things
+    for chunk_size in [1, 2, 5, 1 << 16]:
+        stream = FileStream.from_file(io.StringIO(source), chunk_size)
+        parser = Parser(Lexer(stream))
+        assert list(parser.statements()) == whole
+        assert len(stream.source) <= 2 + chunk_size
+    parser = Parser(Lexer(FileStream.from_file(io.StringIO("{ print 1;\n print 2;\n  let = 2 in 3; }"), 4)))
+    with pytest.raises(TokenError, match="line 3, column 9"):
+        list(parser.statements())
+
+def test_mapped_stream(tmp_path):
+    filename = tmp_path / "prog.txt"
+    filename.write_bytes("{ let s=String \"héllo ✓\" in print s;\r\n print 1;\r print 2;\n }".encode())
+    whole = parse(filename.read_text(encoding="utf-8")).things
+    for chunk_size in [1, 2, 3, 1 << 16]:
+        with open(filename, encoding="utf-8") as f:
+            stream = MappedStream.from_file(f, chunk_size)
+            assert type(stream) is MappedStream
+            assert list(Parser(Lexer(stream)).statements()) == whole
+    (tmp_path / "bad.txt").write_bytes(b"ab\xc3")
+    with open(tmp_path / "bad.txt") as f:
+        stream = MappedStream.from_file(f)
+    assert stream.next_char() == "a" and stream.next_char() == "b"
+    with pytest.raises(UnicodeDecodeError):
+        stream.next_char()
+    (tmp_path / "empty.txt").write_text("")
+    with open(tmp_path / "empty.txt") as f:
+        assert type(MappedStream.from_file(f)) is FileStream
@@ -0,0 +1,452 @@
+from start import *
+from functools import partial
+
+"""
+    Bytecode compiler and stack based virtual machine.
+
+    compile_program lowers an AST into a Code object: a flat list of
+    (opcode, argument) pairs and a pool of constants. VM.execute runs
+    that list with a value stack, so the structural match over node
+    types happens once per node at compile time instead of once per
+    evaluation.
+"""
+
+# Opcodes. Every instruction takes exactly one argument slot.
+LOAD_CONST = 0
+LOAD_LOCAL = 1
+STORE_LOCAL = 2
+LOAD_DEREF = 3
+STORE_DEREF = 4
+MAKE_FUNCTION = 5
+POP = 6
+DUP = 7
+BINARY_OP = 8
+UNARY_OP = 9
+JUMP = 10
+POP_JUMP_IF_FALSE = 11
+POP_JUMP_IF_NOT_TRUE = 12
+JUMP_IF_FALSE_OR_POP = 13
+JUMP_IF_TRUE_OR_POP = 14
+PRINT = 15
+CALL = 16
+RETURN = 17
+RAISE = 18
+LIST_APPEND = 19
+LIST_ASSIGN = 20
+LIST_REMOVE = 21
+LIST_GET = 22
+SLICE = 23
+EVAL = 24
+
+opnames = {value: name for name, value in globals().items()
+           if name.isupper() and isinstance(value, int)}
+
+unary_table = list(unary_functions.values())
+unary_index = {op: i for i, op in enumerate(unary_functions)}
+
+@dataclass
+class Code:
+    instrs: List[int]
+    consts: List
+    name: str = "<program>"
+    frame_size: int = 1
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.instrs), 2):
+            op, arg = self.instrs[pc], self.instrs[pc + 1]
+            lines.append(f"{pc:>5} {opnames[op]:<22} {arg}")
+        return "\n".join(lines)
+
+# pure is set when the body may be memoized (see make_function).
+@dataclass
+class Function:
+    name: str
+    arity: int
+    code: Code
+    pure: bool = False
+
+# A Function bound to the frame it was defined in.
+@dataclass
+class Closure:
+    name: str
+    arity: int
+    code: Code
+    frame: List = field(repr=False)
+    memo: Memo = None
+
+"""
+    Compiler walks the AST once and emits instructions for it.
+    Every expression leaves exactly one value on the stack.
+"""
+class Compiler:
+
+    def __init__(self, name="<program>"):
+        self.instrs = []
+        self.consts = []
+        self.name = name
+
+    def emit(self, op, arg=0):
+        self.instrs.append(op)
+        self.instrs.append(arg)
+        return len(self.instrs) - 2
+
+    def here(self):
+        return len(self.instrs)
+
+    def patch(self, at, target=None):
+        self.instrs[at + 1] = self.here() if target is None else target
+
+    def const(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def code(self, frame_size):
+        self.emit(RETURN)
+        return Code(self.instrs, self.consts, self.name, frame_size)
+
+    def fail(self, error):
+        self.emit(RAISE, self.const(error))
+
+    def checked(self, check, *operands):
+        error = static_check(check, *operands)
+        if error is not None:
+            self.fail(error)
+        return error is None
+
+    def load(self, v):
+        if v.depth is None:
+            self.fail(KeyError())
+        elif v.depth == 0:
+            self.emit(LOAD_LOCAL, v.slot)
+        else:
+            self.emit(LOAD_DEREF, self.const((v.depth, v.slot)))
+
+    def store(self, v):
+        self.emit(DUP)
+        if v.depth is None:
+            self.fail(KeyError())
+        elif v.depth == 0:
+            self.emit(STORE_LOCAL, v.slot)
+        else:
+            self.emit(STORE_DEREF, self.const((v.depth, v.slot)))
+
+    def compile(self, program):
+        match program:
+            case NumLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+            case StringLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+            case IntLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+            case FracLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+            case Variable() as v:
+                self.load(v)
+            case ListLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+            case BoolLiteral(value):
+                self.emit(LOAD_CONST, self.const(value))
+
+            case Let(Variable() as v, e1, e2) | LetConst(Variable() as v, e1, e2):
+                self.compile(e1)
+                self.emit(STORE_LOCAL, v.slot)
+                self.compile(e2)
+
+            case Put(Variable(_) as v, e):
+                self.compile(e)
+                self.store(v)
+            case Get(Variable() as v):
+                self.load(v)
+            case Seq(things):
+                if not things:
+                    self.emit(LOAD_CONST, self.const(None))
+                for i, thing in enumerate(things):
+                    if i:
+                        self.emit(POP)
+                    self.compile(thing)
+
+            case BinOp(op, left, right) if op in Bitwise_operators:
+                if self.checked(check_bitwise, left, right):
+                    self.compile(left)
+                    self.compile(right)
+                    self.emit(BINARY_OP, binary_opcodes[op])
+            case BinOp("+=", left, right):
+                if self.checked(check_add_assign, left, right):
+                    self.load(left)
+                    self.compile(right)
+                    self.emit(BINARY_OP, binary_opcodes["+"])
+                    self.store(left)
+            case BinOp(op, left, right) if op in binary_functions:
+                self.compile(left)
+                self.compile(right)
+                self.emit(BINARY_OP, binary_opcodes[op])
+
+            case PrintOp(inp):
+                self.compile(inp)
+                self.emit(PRINT)
+
+            case StringOp('add', left, right):
+                if self.checked(check_concat, left, right):
+                    self.compile(left)
+                    self.compile(right)
+                    self.emit(BINARY_OP, binary_opcodes["concat"])
+            case StringOp('compare', left, right):
+                if self.checked(check_compare, left, right):
+                    self.compile(left)
+                    self.compile(right)
+                    self.emit(BINARY_OP, binary_opcodes["=="])
+            case StringOp('length', left):
+                if self.checked(check_length, left):
+                    self.compile(left)
+                    self.emit(UNARY_OP, unary_index["length"])
+            case StringSlice("slice", left, start, stop, step):
+                self.compile(left)
+                self.compile(start)
+                self.compile(stop)
+                self.compile(step)
+                self.emit(SLICE)
+
+            # The operand of a unary operator is written back, so it
+            # has to be a variable for the store to succeed.
+            case UnOp(op, vari) if op in Unary_operators:
+                self.compile(vari)
+                self.emit(UNARY_OP, unary_index[op])
+                if isinstance(vari, Variable):
+                    self.store(vari)
+                else:
+                    self.fail(InvalidProgram())
+
+            case LogOp("and", left, right):
+                self.compile(left)
+                jump = self.emit(JUMP_IF_FALSE_OR_POP)
+                self.compile(right)
+                self.patch(jump)
+            case LogOp("or", left, right):
+                self.compile(left)
+                jump = self.emit(JUMP_IF_TRUE_OR_POP)
+                self.compile(right)
+                self.patch(jump)
+            case LogOp("not", right):
+                self.compile(right)
+                self.emit(UNARY_OP, unary_index["not"])
+
+            case If(c, b):
+                self.compile(c)
+                orelse = self.emit(POP_JUMP_IF_NOT_TRUE)
+                self.compile(b)
+                end = self.emit(JUMP)
+                self.patch(orelse)
+                self.emit(LOAD_CONST, self.const(None))
+                self.patch(end)
+            case IfElse(c, l, r):
+                self.compile(c)
+                orelse = self.emit(POP_JUMP_IF_NOT_TRUE)
+                self.compile(l)
+                end = self.emit(JUMP)
+                self.patch(orelse)
+                self.compile(r)
+                self.patch(end)
+
+            case ListOp("append", left, right):
+                self.compile(left)
+                self.compile(right)
+                self.emit(LIST_APPEND)
+            case ListOp('length', left):
+                self.compile(left)
+                self.emit(UNARY_OP, unary_index["length"])
+            # eval evaluates the stored value before the index.
+            case ListOp('assign', array, index, assign):
+                self.compile(array)
+                self.compile(assign)
+                self.compile(index)
+                self.emit(LIST_ASSIGN)
+            case ListOp('remove', array):
+                self.compile(array)
+                self.emit(LIST_REMOVE)
+            case ListOp('get', array, index):
+                self.compile(array)
+                self.compile(index)
+                self.emit(LIST_GET)
+
+            case Un_boolify(left):
+                self.compile(left)
+                self.emit(UNARY_OP, unary_index["unboolify"])
+
+            case For(condition, update, body):
+                top = self.here()
+                self.compile(condition)
+                end = self.emit(POP_JUMP_IF_FALSE)
+                self.compile(body)
+                self.emit(POP)
+                self.compile(update)
+                self.emit(POP)
+                self.emit(JUMP, top)
+                self.patch(end)
+                self.emit(LOAD_CONST, self.const(None))
+            case Whilethen(condition, then_body):
+                top = self.here()
+                self.compile(condition)
+                end = self.emit(POP_JUMP_IF_NOT_TRUE)
+                self.compile(then_body)
+                self.emit(POP)
+                self.emit(JUMP, top)
+                self.patch(end)
+                self.emit(LOAD_CONST, self.const(None))
+
+            case LetFun(Variable() as v, params, body, expr, frame_size):
+                fn = Function(v.name, len(params), compile_code(body, v.name, frame_size), pure_body(body))
+                self.emit(MAKE_FUNCTION, self.const(fn))
+                self.emit(STORE_LOCAL, v.slot)
+                self.compile(expr)
+            case FunCall(Variable() as v, args):
+                self.load(v)
+                for arg in args:
+                    self.compile(arg)
+                self.emit(CALL, len(args))
+
+            case _:
+                self.fail(InvalidProgram())
+
+def compile_code(program: AST, name, frame_size) -> Code:
+    compiler = Compiler(name)
+    compiler.compile(program)
+    return compiler.code(frame_size)
+
+# A program scoping_agrees turns down is kept whole for EVAL.
+def compile_program(program: AST) -> Code:
+    if not scoping_agrees(program):
+        return Code([EVAL, 0, RETURN, 0], [program])
+    program, frame_size = resolve(program)
+    return compile_code(program, "<program>", frame_size)
+
+"""
+    VM executes Code objects. Variables live in list frames laid out
+    by resolve: LOAD_LOCAL and STORE_LOCAL index the current frame and
+    the DEREF variants first follow frame[0] links up to the frame of
+    an enclosing function.
+"""
+class VM:
+
+    def execute(self, code: Code, frame: List = None) -> Value:
+        if frame is None:
+            frame = [None] * code.frame_size
+        instrs = code.instrs
+        consts = code.consts
+        binary = binary_table
+        unary = unary_table
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        write = output.write
+        pc = 0
+        while True:
+            op = instrs[pc]
+            arg = instrs[pc + 1]
+            pc += 2
+            if op == LOAD_LOCAL:
+                push(frame[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == BINARY_OP:
+                right = pop()
+                stack[-1] = binary[arg](stack[-1], right)
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == STORE_LOCAL:
+                frame[arg] = pop()
+            elif op == POP:
+                pop()
+            elif op == JUMP:
+                pc = arg
+            elif op == DUP:
+                push(stack[-1])
+            elif op == LOAD_DEREF:
+                depth, slot = consts[arg]
+                outer = frame
+                for _ in range(depth):
+                    outer = outer[0]
+                push(outer[slot])
+            elif op == STORE_DEREF:
+                depth, slot = consts[arg]
+                outer = frame
+                for _ in range(depth):
+                    outer = outer[0]
+                outer[slot] = pop()
+            elif op == POP_JUMP_IF_NOT_TRUE:
+                if pop() != True:
+                    pc = arg
+            elif op == UNARY_OP:
+                stack[-1] = unary[arg](stack[-1])
+            # list_index, inlined; an IntList is read through its items
+            elif op == LIST_GET:
+                index = int(pop())
+                array = stack[-1]
+                if not 0 <= index < len(array):
+                    raise InvalidProgram()
+                if type(array) is IntList:
+                    array = array.items
+                stack[-1] = array[index]
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if not stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == PRINT:
+                write(stack[-1])
+                stack[-1] = None
+            elif op == CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                fn = stack[-1]
+                if arg != fn.arity:
+                    raise InvalidProgram()
+                fn_code = fn.code
+                call_frame = [None] * fn_code.frame_size
+                call_frame[0] = fn.frame
+                call_frame[1:1 + arg] = args
+                if fn.memo is None:
+                    stack[-1] = self.execute(fn_code, call_frame)
+                else:
+                    stack[-1] = fn.memo(call_frame)
+            # Each closure of a pure function gets its own Memo, as
+            # each run gets its own in eval.
+            elif op == MAKE_FUNCTION:
+                fn = consts[arg]
+                closure = Closure(fn.name, fn.arity, fn.code, frame)
+                if fn.pure and memo_size:
+                    closure.memo = Memo(fn.arity, partial(self.execute, fn.code), memo_size)
+                push(closure)
+            elif op == LIST_APPEND:
+                value = pop()
+                stack[-1] = list_append(stack[-1], value)
+            elif op == LIST_ASSIGN:
+                index = pop()
+                value = pop()
+                stack[-1] = list_assign(stack[-1], index, value)
+            elif op == LIST_REMOVE:
+                stack[-1].pop()
+            elif op == SLICE:
+                step = pop()
+                stop = pop()
+                start = pop()
+                stack[-1] = slice_text(stack[-1], start, stop, step)
+            elif op == RETURN:
+                return pop()
+            elif op == RAISE:
+                raise consts[arg].with_traceback(None)
+            elif op == EVAL:
+                push(eval(consts[arg]))
+            else:
+                raise InvalidProgram()
+
+def run(program: AST, vm: VM = None) -> Value:
+    if vm is None:
+        vm = VM()
+    return vm.execute(compile_program(program))